@@ -0,0 +1,10 @@
+"""End-to-end benchmark: synthetic users driving the dispatcher.
+
+Run from the repository root::
+
+    python -m bench [--users 50] [--concurrency 10] [--only blitz,admin] [--output bench_results.json]
+
+No Telegram or Redis is needed: Bot API calls go to :class:`bench.fakes.FakeSession`
+and storage is :class:`bench.fakes.CountingRedis`, a MemoryRedis that counts
+commands and round trips.
+"""
@@ -0,0 +1,164 @@
+"""Run every scenario on its own, then a weighted mix of all of them.
+
+For each run prints and saves updates/sec, p50/p99 dispatcher latency,
+Redis commands and round trips per update and Bot API calls per update.
+A run fails if an update a scenario sent with :meth:`Player.ask` was not
+handled by the handler it names.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+# before bot is imported: no real token, web search or send rate limits
+os.environ.setdefault("API_TOKEN", "123456:bench")
+os.environ["BING_API_KEY"] = ""
+for var in ("SEND_RATE", "SEND_CHAT_RATE", "SEND_CHAT_BURST"):
+    os.environ[var] = "1000000"
+
+from bench.fakes import CountingRedis, FakeSession  # noqa: E402
+from bench.scenarios import ADMIN_SCENARIOS, SCENARIOS, Player  # noqa: E402
+from bot import ADMIN_IDS, bot, dp, stats_buffer  # noqa: E402
+from services import storage  # noqa: E402
+from services.instrumentation import HANDLER_CALLS  # noqa: E402
+
+RESULTS_PATH = "bench_results.json"
+
+redis = CountingRedis()
+session = FakeSession()
+
+
+async def _connect(url: str) -> None:
+    storage.redis = redis
+
+
+def _handled() -> Counter[str]:
+    calls: Counter[str] = Counter()
+    for (router, handler, _), count in HANDLER_CALLS.values.items():
+        calls[f"{router}:{handler}"] += int(count)
+    return calls
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(picks: list[tuple], concurrency: int) -> dict:
+    latencies: list[float] = []
+    expected: Counter[str] = Counter()
+    gate = asyncio.Semaphore(concurrency)
+    uids = itertools.count(10**9)
+    admin = next(iter(ADMIN_IDS))
+
+    async def play(name: str) -> None:
+        uid = admin if name in ADMIN_SCENARIOS else next(uids)
+        async with gate:
+            await SCENARIOS[name][0](Player(bot, dp, session, uid, latencies, expected))
+
+    redis.reset()
+    session.calls.clear()
+    before = _handled()
+    started = time.perf_counter()
+    await asyncio.gather(*(play(name) for name in picks))
+    # the write-behind buffer is part of the cost of these updates
+    await stats_buffer.flush()
+    elapsed = time.perf_counter() - started
+    handled = _handled() - before
+    missed = {h: n - handled[h] for h, n in expected.items() if handled[h] < n}
+    if missed:
+        raise RuntimeError(f"updates not handled where expected: {missed}")
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "users": len(picks),
+        "updates": count,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(count / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "redis_commands_per_update": round(sum(redis.commands.values()) / count, 2),
+        "redis_round_trips_per_update": round(redis.round_trips / count, 2),
+        "api_calls_per_update": round(sum(session.calls.values()) / count, 2),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def main(args: argparse.Namespace) -> dict:
+    random.seed(args.seed)
+    storage.connect = _connect
+    # the real session's middlewares (send scheduler, API metrics) stay in the chain
+    session.middleware = bot.session.middleware
+    bot.session = session
+    await dp.emit_startup(bot=bot)
+    # let the startup tasks (media warm-up, retention pass) finish
+    await asyncio.sleep(0.5)
+    names = args.only or list(SCENARIOS)
+    runs = {}
+    try:
+        for name in names:
+            runs[name] = await run([name] * args.users, args.concurrency)
+            _print(name, runs[name])
+        weights = [SCENARIOS[name][1] for name in names]
+        runs["mixed"] = await run(random.choices(names, weights, k=args.users * len(names)), args.concurrency)
+        _print("mixed", runs["mixed"])
+    finally:
+        await dp.emit_shutdown(bot=bot)
+    return {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "options": {"users": args.users, "concurrency": args.concurrency, "seed": args.seed},
+        "runs": runs,
+    }
+
+
+def _print(name: str, r: dict) -> None:
+    print(
+        f"{name:<8} {r['updates']:>6} updates  {r['updates_per_sec']:>8.1f}/s  "
+        f"p50 {r['p50_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  "
+        f"redis {r['redis_commands_per_update']:>5.2f} cmd / {r['redis_round_trips_per_update']:>5.2f} rtt  "
+        f"api {r['api_calls_per_update']:.2f}"
+    )
+
+
+def _parse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__)
+    parser.add_argument("--users", type=int, default=50, help="synthetic users per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="users active at once")
+    parser.add_argument("--only", type=lambda s: s.split(","), help=f"comma-separated: {','.join(SCENARIOS)}")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+    unknown = set(args.only or ()) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    args = _parse()
+    # one log line per update would dominate the timings
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    results = asyncio.run(main(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Saved to {args.output}", file=sys.stderr)
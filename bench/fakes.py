@@ -0,0 +1,121 @@
+"""Stand-ins for the Bot API and Redis used by the benchmark."""
+from __future__ import annotations
+
+import inspect
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetFile, TelegramMethod
+from aiogram.types import Chat, File, Message, ReplyKeyboardMarkup
+
+from services.storage import MemoryPipeline, MemoryRedis, MemoryScript
+
+
+class FakeSession(BaseSession):
+    """Answers every Bot API call locally and remembers each chat's reply keyboard."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: Counter[str] = Counter()
+        # chat id -> button texts of the last reply keyboard sent there
+        self.keyboards: dict[int, list[str]] = {}
+        self._message_ids = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        markup = getattr(method, "reply_markup", None)
+        if isinstance(markup, ReplyKeyboardMarkup):
+            self.keyboards[int(method.chat_id)] = [b.text for row in markup.keyboard for b in row]
+        if isinstance(method, GetFile):
+            return File(file_id=method.file_id, file_unique_id=method.file_id[-16:])
+        if method.__api_method__.startswith("send"):
+            self._message_ids += 1
+            return Message(
+                message_id=self._message_ids,
+                date=int(time.time()),
+                chat=Chat(id=int(method.chat_id), type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncIterator[bytes]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class CountingPipeline(MemoryPipeline):
+    store: "CountingRedis"
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        self.store.round_trips += 1
+        self.store.batched = True
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            self.store.batched = False
+
+
+class CountingScript(MemoryScript):
+    store: "CountingRedis"
+
+    async def run(self, keys, args) -> Any:
+        self.store.count("evalsha")
+        return await super().run(keys, args)
+
+
+class CountingRedis(MemoryRedis):
+    """MemoryRedis that counts the commands and round trips a real server would see."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.commands: Counter[str] = Counter()
+        self.round_trips = 0
+        # commands queued on a pipeline share its round trip
+        self.batched = False
+        # set while a counted command runs, so commands it is built on (exists) aren't counted
+        self.inside = False
+
+    def count(self, command: str) -> None:
+        self.commands[command] += 1
+        if not self.batched:
+            self.round_trips += 1
+
+    def reset(self) -> None:
+        self.commands.clear()
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True) -> CountingPipeline:
+        return CountingPipeline(self)
+
+    def register_script(self, lua: str) -> CountingScript:
+        script = super().register_script(lua)
+        return CountingScript(self, script.impl)
+
+    async def scan_iter(self, match: str = "*", count: Optional[int] = None) -> AsyncIterator[str]:
+        self.count("scan")
+        async for key in super().scan_iter(match, count):
+            yield key
+
+
+def _counted(name: str, method: Any) -> Any:
+    async def counted(self: CountingRedis, *args: Any, **kwargs: Any) -> Any:
+        if self.inside:
+            return await method(self, *args, **kwargs)
+        self.count(name)
+        self.inside = True
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            self.inside = False
+
+    return counted
+
+
+for _name, _method in vars(MemoryRedis).items():
+    if inspect.iscoroutinefunction(_method) and not _name.startswith("_") and _name not in ("ping", "aclose"):
+        setattr(CountingRedis, _name, _counted(_name, _method))
@@ -0,0 +1,158 @@
+"""Synthetic users: each scenario is what one user does in a session.
+
+Importing this module imports ``bot``; :mod:`bench.__main__` sets the
+environment up first.
+"""
+from __future__ import annotations
+
+import itertools
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bench.fakes import FakeSession
+from bot import CATALOG, QUIZ
+from routers.ai_live import COMPETITORS
+from services import catalog
+
+# buttons that leave a game rather than answer it
+NAVIGATION = {"Главное меню", "🏠 Главное меню", "Назад к меню", "Назад"}
+# questions the local KB can't answer; they go to web search (disabled in the bench)
+OPEN_QUESTIONS = ("как приготовить негрони", "что такое купаж", "чем ром отличается от кашасы")
+# brands neither the catalog nor the local KB knows
+UNKNOWN_BRANDS = ("Kavalan", "Glen Scotia", "Старый Мельник")
+# AI-live questions about a competitor or a brand; {} is the name
+QUESTION_TEMPLATES = ("{}", "расскажи про {}", "{} — что это за напиток?", "чем {} отличается от конкурентов")
+
+_ids = itertools.count(1)
+
+
+class Player:
+    """One synthetic user; records the dispatcher latency of every update it sends."""
+
+    def __init__(
+        self, bot: Bot, dp: Dispatcher, session: FakeSession, uid: int,
+        latencies: list[float], expected: Counter[str],
+    ) -> None:
+        self.bot = bot
+        self.dp = dp
+        self.session = session
+        self.uid = uid
+        self.latencies = latencies
+        # "router:handler" -> updates sent that it must handle
+        self.expected = expected
+        self.user = {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"bench{uid}"}
+        self.chat = {"id": uid, "type": "private"}
+
+    async def _feed(self, raw: dict) -> None:
+        update = Update.model_validate({"update_id": next(_ids), **raw}, context={"bot": self.bot})
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+    async def send(self, text: str) -> None:
+        await self._feed({"message": {
+            "message_id": next(_ids), "date": int(time.time()), "chat": self.chat, "from": self.user, "text": text,
+        }})
+
+    async def press(self, data: str) -> None:
+        await self._feed({"callback_query": {
+            "id": str(next(_ids)), "from": self.user, "chat_instance": str(self.uid), "data": data,
+            "message": {"message_id": next(_ids), "date": int(time.time()), "chat": self.chat, "text": "…"},
+        }})
+
+    async def ask(self, text: str, handler: str) -> None:
+        """Send ``text``, which ``handler`` (``router:callback``) must answer."""
+        self.expected[handler] += 1
+        await self.send(text)
+
+    def options(self) -> list[str]:
+        """Answer buttons of the reply keyboard the bot sent last."""
+        return [text for text in self.session.keyboards.get(self.uid, ()) if text not in NAVIGATION]
+
+    async def answer(self, questions: int) -> None:
+        for _ in range(questions):
+            await self.send(random.choice(self.options()))
+
+
+async def menu(p: Player) -> None:
+    await p.send("/start")
+    await p.send("🗂️ Меню брендов")
+    for category in random.sample(list(CATALOG.categories.values()), 2):
+        await p.send(category.button)
+        await p.send(random.choice(category.brands))
+        await p.send(catalog.BACK_TO_CATEGORIES)
+    await p.send("Назад")
+    await p.send("📊 Моя статистика")
+    await p.send("🧠 Тренажёр знаний")
+    await p.send("Назад к меню")
+
+
+def _brands() -> list[catalog.Brand]:
+    return list(CATALOG.brands.values())
+
+
+async def alias_lookup(p: Player) -> None:
+    for brand in random.sample([b for b in _brands() if b.aliases], 8):
+        await p.send(random.choice(brand.aliases))
+
+
+def _partial(brand: catalog.Brand) -> str:
+    word = random.choice((brand.name, *brand.aliases)).lower()
+    return word[:random.randint(3, max(3, min(6, len(word) - 1)))]
+
+
+async def partial_text(p: Player) -> None:
+    for brand in random.sample(_brands(), 8):
+        await p.send(_partial(brand))
+
+
+def _game(button: str, bank: str) -> Callable[[Player], Awaitable[None]]:
+    async def play(p: Player) -> None:
+        await p.send("🧠 Тренажёр знаний")
+        await p.send(button)
+        await p.answer(getattr(QUIZ, bank).per_game)
+
+    play.__name__ = bank
+    return play
+
+
+blitz = _game("⚡️ Блиц", "blitz")
+truth = _game("🟢 Верю — не верю", "truth")
+assoc = _game("🔗 Ассоциации", "assoc")
+
+
+async def admin_top(p: Player) -> None:
+    await p.send("👑 Админ-панель")
+    for button in ("📊 Топ-10 по блицу", "📝 Топ-10 по тестам", "🏷️ Топ-10 по брендам", "🎯 Топ-10 по баллам"):
+        await p.send(button)
+    await p.send("📈 Суточная активность")
+    await p.send("🏠 Главное меню")
+
+
+async def ai_live(p: Player) -> None:
+    await p.press("ai:enter")
+    for name, (aliases, _, _) in random.sample(list(COMPETITORS.items()), 2):
+        await p.ask(random.choice(QUESTION_TEMPLATES).format(random.choice((name, *aliases))), "ai_live:ai_live_query")
+    await p.ask(random.choice(QUESTION_TEMPLATES).format(random.choice(UNKNOWN_BRANDS)), "ai_live:ai_live_query")
+    await p.ask(f"расскажи про {random.choice(_brands()).name}", "ai_live:ai_live_query")
+    await p.ask(random.choice(OPEN_QUESTIONS), "ai_live:ai_live_query")
+    await p.press("ai:exit")
+
+
+# name -> (scenario, weight in the mixed run)
+SCENARIOS: dict[str, tuple[Callable[[Player], Awaitable[None]], int]] = {
+    "menu": (menu, 30),
+    "alias": (alias_lookup, 20),
+    "partial": (partial_text, 15),
+    "blitz": (blitz, 5),
+    "truth": (truth, 10),
+    "assoc": (assoc, 10),
+    "admin": (admin_top, 2),
+    "ai_live": (ai_live, 8),
+}
+ADMIN_SCENARIOS = {"admin"}
@@ -1,40 +1,148 @@
 import os
 import logging
 import asyncio
-from flask import Flask, request, Response
-from aiogram import Bot, Dispatcher
+import secrets
+from typing import Optional
+from aiohttp import web
+from pydantic import ValidationError
 from aiogram.types import Update
-from bot import dp, bot
+from bot import dp, bot, inline_aggregator, send_scheduler, stats_buffer
+from routers import ai_live
+from services import event_log, inline_reply, media, metrics, timing, web_search
 
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "MARS")
 WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
 WEBHOOK_URL = os.getenv("WEBHOOK_URL") + WEBHOOK_PATH
 
-app = Flask(__name__)
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+# Сколько апдейтов обрабатываем одновременно. Когда лимит выбран, webhook
+# не отвечает Telegram, пока не освободится место, — это и есть backpressure.
+MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "64"))
+MAX_BODY_SIZE = 1024 * 1024
+SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", "25"))
 
-@app.post(WEBHOOK_PATH)
-def handle_webhook():
-    update = Update.model_validate(request.json)
-    loop.create_task(dp.feed_update(bot, update))
-    return Response()
+update_gate = asyncio.Semaphore(MAX_IN_FLIGHT)
 
-@app.route("/")
-def hello():
-    return "Bot is alive"
+if inline_reply.INLINE_REPLY:
+    bot.session.middleware(inline_reply.InlineReplyMiddleware())
+in_flight: set[asyncio.Task] = set()
 
-# 🧠 Функция запуска
-async def main():
-    await bot.set_webhook(WEBHOOK_URL)
+metrics.collect("bot_webhook", "Webhook updates accepted and not finished", lambda: {"in_flight": len(in_flight)})
+metrics.collect("bot_web_search", "Web search cache and breaker", web_search.metrics)
+metrics.collect("bot_local_kb", "Local knowledge base lookups", lambda: ai_live.LOCAL_KB.stats())
+metrics.collect("bot_send", "Send scheduler", send_scheduler.metrics)
+metrics.collect(
+    "bot_media", "Brand photo registry",
+    lambda: {k: v for k, v in media.metrics().items() if k != "failures"},
+)
+metrics.collect(
+    "bot_events", "Activity event buffer",
+    lambda: {**stats_buffer.metrics(), "aggregated_inline": inline_aggregator.applied},
+)
+
+
+async def read_body(request: web.Request) -> bytes:
+    """Read the request body chunk by chunk, refusing oversized payloads."""
+    chunks: list[bytes] = []
+    size = 0
+    async for chunk in request.content.iter_chunked(64 * 1024):
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_BODY_SIZE, actual_size=size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def process_update(update: Update, slot: Optional[inline_reply.ReplySlot] = None) -> None:
+    inline_reply.current_slot.set(slot)
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        logging.exception("Update %s failed", update.update_id)
+    finally:
+        if slot is not None:
+            slot.finish()
+        update_gate.release()
+
+
+async def handle_webhook(request: web.Request) -> web.Response:
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not secrets.compare_digest(token, WEBHOOK_SECRET):
+        return web.Response(status=401)
+    body = await read_body(request)
+    try:
+        update = Update.model_validate_json(body, context={"bot": bot})
+    except ValidationError:
+        return web.Response(status=400)
+    await update_gate.acquire()
+    slot = inline_reply.ReplySlot() if inline_reply.INLINE_REPLY else None
+    task = asyncio.create_task(process_update(update, slot))
+    in_flight.add(task)
+    task.add_done_callback(in_flight.discard)
+    if slot is not None:
+        # Ответ на простой апдейт уходит прямо в теле ответа webhook
+        method = await slot.wait()
+        if method is not None:
+            return web.Response(body=inline_reply.build_reply(bot, method))
+    return web.Response()
+
+
+async def hello(request: web.Request) -> web.Response:
+    return web.Response(text="Bot is alive")
+
+
+async def search_stats(request: web.Request) -> web.Response:
+    return web.json_response({**web_search.metrics(), "local_kb": ai_live.LOCAL_KB.stats()})
+
+
+async def media_stats(request: web.Request) -> web.Response:
+    return web.json_response(media.metrics())
+
+
+async def event_stats(request: web.Request) -> web.Response:
+    return web.json_response({
+        **stats_buffer.metrics(),
+        "log": await event_log.info(),
+        "aggregated_inline": inline_aggregator.applied,
+    })
+
+
+async def slow_updates(request: web.Request) -> web.Response:
+    return web.json_response(timing.snapshot())
+
+
+async def prometheus_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def on_startup(app: web.Application) -> None:
+    await dp.emit_startup(bot=bot)
+    await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
     print(f"✅ Webhook установлен: {WEBHOOK_URL}")
-    import hypercorn.asyncio
-    import hypercorn.config
-    config = hypercorn.config.Config()
-    config.bind = ["0.0.0.0:10000"]
-    await hypercorn.asyncio.serve(app, config)
+
+
+async def on_shutdown(app: web.Application) -> None:
+    # Дожидаемся апдейтов, которые уже приняты, чтобы не терять их при рестарте
+    if in_flight:
+        logging.info("Waiting for %d in-flight updates", len(in_flight))
+        await asyncio.wait(set(in_flight), timeout=SHUTDOWN_TIMEOUT)
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+
+
+# 🧠 Сборка приложения
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    app.router.add_get("/", hello)
+    app.router.add_get("/stats/search", search_stats)
+    app.router.add_get("/stats/media", media_stats)
+    app.router.add_get("/stats/events", event_stats)
+    app.router.add_get("/stats/slow", slow_updates)
+    app.router.add_get("/metrics", prometheus_metrics)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
 
 # 🚀 Запуск
 if __name__ == "__main__":
-    loop.run_until_complete(main())
-
+    web.run_app(create_app(), host="0.0.0.0", port=10000)
@@ -1,8 +1,6 @@
 from __future__ import annotations
-import os
 import re
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 
 from aiogram import Router, F
 from aiogram.filters import Command
@@ -10,9 +8,22 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import aiohttp
 
-router = Router()
+from services import web_search
+from services.event_buffer import EventBuffer
+from services.local_kb import KBEntry, LocalKB
+
+router = Router(name="ai_live")
+
+
+@router.startup()
+async def open_http() -> None:
+    await web_search.start()
+
+
+@router.shutdown()
+async def close_http() -> None:
+    await web_search.close()
 
 
 class Mode(StatesGroup):
@@ -20,78 +31,86 @@ class Mode(StatesGroup):
 
 
 def norm(s: str) -> str:
-    s = (s or "").lower().strip()
+    s = (s or "").lower()
     s = s.replace("ё", "е")
+    s = re.sub(r"[’'`]", "", s)
     s = re.sub(r"[^a-zа-я0-9\s]", " ", s)
     s = re.sub(r"\s+", " ", s)
-    return s
-
-
-@dataclass
-class BrandLocal:
-    title: str
-    summary: str
+    return s.strip()
 
 
-LOCAL_DB: Dict[str, BrandLocal] = {
-    norm("Monkey Shoulder"): BrandLocal(
-        title="Monkey Shoulder",
-        summary="Blended Malt Scotch (100% солодовые). Мягкий профиль, силён в коктейлях и в чистом.",
+# Конкуренты: алиасы, краткая справка и наш аналог
+COMPETITORS: Dict[str, Tuple[List[str], str, str]] = {
+    "Dewar's": (
+        ["dewars", "деварс", "дьюарс"],
+        "Купажированный шотландский виски (Bacardi).",
+        "Monkey Shoulder",
+    ),
+    "Ballantine's": (
+        ["ballantines", "баллантайнс", "балантайнс"],
+        "Купажированный шотландский виски (Pernod Ricard).",
+        "Grant’s",
+    ),
+    "Jameson": (
+        ["jameson", "джеймсон", "джемисон"],
+        "Ирландский купажированный виски тройной дистилляции (Pernod Ricard).",
+        "Tullamore D.E.W.",
+    ),
+    "Johnnie Walker": (
+        ["johnnie walker", "джонни уокер"],
+        "Купажированный шотландский виски (Diageo).",
+        "Grant’s",
+    ),
+    "Chivas Regal": (
+        ["chivas", "чивас"],
+        "Купажированный шотландский виски выдержкой от 12 лет (Pernod Ricard).",
+        "Glenfiddich 12",
     ),
 }
 
 
-OUR_ALTS: Dict[str, str] = {
-    "dewars": "Monkey Shoulder",
-    "ballantines": "Grant’s",
-    "jameson": "Tullamore D.E.W.",
-    "johnnie walker": "Grant’s",
-    "chivas": "Glenfiddich 12",
-}
+def build_kb(brands: Dict[str, Tuple[Callable, List[str]]]) -> LocalKB:
+    """Index the competitors and our brands (``name -> (card handler, aliases)``)."""
+    base = LocalKB()
+    for title, (aliases, summary, our_alt) in COMPETITORS.items():
+        base.add(KBEntry(title, summary, our_alt=our_alt), [norm(a) for a in (title, *aliases)])
+    for title, (show, aliases) in brands.items():
+        base.add(KBEntry(title, show=show), [norm(a) for a in (title, *aliases)])
+    return base
 
 
-def live_kb():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Выйти из AI-режима", callback_data="ai:exit")
-    return kb.as_markup()
+# Наши бренды добавляет bot.py при старте через load_brands(): импортировать
+# их отсюда нельзя — bot.py сам импортирует этот роутер.
+LOCAL_KB = build_kb({})
 
 
-def local_lookup(q: str) -> Optional[str]:
-    key = norm(q)
-    if key in LOCAL_DB:
-        b = LOCAL_DB[key]
-        return f"<b>{b.title}</b> — {b.summary}"
-    for k, b in LOCAL_DB.items():
-        if key and (key in k or k in key):
-            return f"<b>{b.title}</b> — {b.summary}"
-    return None
+def load_brands(brands: Dict[str, Tuple[Callable, List[str]]]) -> None:
+    global LOCAL_KB
+    LOCAL_KB = build_kb(brands)
 
 
-BING_ENDPOINT = "https://api.bing.microsoft.com/v7.0/search"
+def live_kb():
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Выйти из AI-режима", callback_data="ai:exit")
+    return kb.as_markup()
 
 
-async def bing_search(query: str, *, mkt: str = "ru-RU", count: int = 5) -> List[Dict]:
-    api_key = os.getenv("BING_API_KEY")
-    if not api_key:
-        return []
-    headers = {"Ocp-Apim-Subscription-Key": api_key}
-    params = {"q": query, "mkt": mkt, "count": count, "textDecorations": False, "textFormat": "Raw"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BING_ENDPOINT, headers=headers, params=params, timeout=15) as r:
-            if r.status != 200:
-                return []
-            data = await r.json()
-            return data.get("webPages", {}).get("value", [])
+def local_lookup(q: str) -> Optional[KBEntry]:
+    return LOCAL_KB.lookup(norm(q))
 
 
 def pick_our_alt(q: str) -> Optional[str]:
     qn = norm(q)
-    for k, v in OUR_ALTS.items():
-        if k in qn:
-            return v
+    for aliases, _, our_alt in COMPETITORS.values():
+        if aliases[0] in qn:
+            return our_alt
     return None
 
 
+async def bing_search(query: str, *, mkt: str = "ru-RU", count: int = 5) -> List[Dict]:
+    return await web_search.search(query, norm(query), mkt=mkt, count=count)
+
+
 def summarize_results(results: List[Dict]) -> Tuple[str, List[str]]:
     best_title = results[0]["name"] if results else ""
     facts: List[str] = []
@@ -151,12 +170,19 @@ async def ai_live_start_btn(c: CallbackQuery, state: FSMContext):
 
 
 @router.message(Mode.ai_live, F.text.as_("q"))
-async def ai_live_query(m: Message, state: FSMContext, q: str):
-    ans = local_lookup(q)
-    if ans:
-        await m.answer(ans, reply_markup=live_kb())
+async def ai_live_query(m: Message, state: FSMContext, q: str, stats_buffer: EventBuffer):
+    entry = local_lookup(q)
+    if entry and entry.show:
+        stats_buffer.ai_query("brand")
+        await entry.show(m)
+        return
+    if entry:
+        stats_buffer.ai_query("kb")
+        text = build_comp_answer(entry.title, [entry.summary], entry.our_alt)
+        await m.answer(text, reply_markup=live_kb())
         return
     results = await bing_search(q)
+    stats_buffer.ai_query("web" if results else "none")
     our_alt = pick_our_alt(q)
     if results:
         title, facts = summarize_results(results)
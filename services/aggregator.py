@@ -0,0 +1,231 @@
+"""Consumer-group worker that builds the stats keys from the event stream.
+
+Each worker reads batches of up to ``AGGREGATOR_BATCH`` events as one
+consumer of the ``aggregator`` group, merges them per user and day and
+writes the aggregates in one MULTI/EXEC, together with an
+``events:applied:{id}`` marker for every entry. The entries are XACKed
+afterwards and their markers deleted. An entry delivered again (claimed
+from a dead consumer, or replayed after a restart) that still has its
+marker was written before the XACK was lost, so it is only acknowledged,
+never applied twice.
+
+MULTI doesn't roll back: the result of every command is checked, and the
+events of a user and day whose writes did not all succeed are copied to
+the ``events:dead`` stream with the error and acknowledged, as are
+malformed entries and entries delivered more than
+``AGGREGATOR_MAX_DELIVERIES`` times. Entries a dead consumer left pending
+for ``AGGREGATOR_CLAIM_IDLE`` ms are claimed by the others; entries
+trimmed from the stream while pending are logged and acknowledged.
+
+The bot runs one worker in-process unless ``AGGREGATOR_INLINE=0``; more
+can be started with ``python -m services.aggregator [consumer-name]``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from typing import Optional
+
+from dotenv import load_dotenv
+from redis.exceptions import ResponseError
+
+from services import event_log, stats, storage
+from services.event_log import DEAD_KEY, GROUP, STREAM_KEY, Event
+
+INLINE = os.getenv("AGGREGATOR_INLINE", "1") == "1"
+BATCH = int(os.getenv("AGGREGATOR_BATCH", "500"))
+BLOCK_MS = int(os.getenv("AGGREGATOR_BLOCK_MS", "1000"))
+CLAIM_IDLE_MS = int(os.getenv("AGGREGATOR_CLAIM_IDLE", "60000"))
+MAX_DELIVERIES = int(os.getenv("AGGREGATOR_MAX_DELIVERIES", "5"))
+DEAD_MAXLEN = int(os.getenv("AGGREGATOR_DEAD_MAXLEN", "10000"))
+# safety net: markers are deleted with the XACK
+APPLIED_TTL = 86400
+
+
+def applied_key(entry_id: str) -> str:
+    return f"{STREAM_KEY}:applied:{entry_id}"
+
+
+class Aggregator:
+    def __init__(self, consumer: Optional[str] = None) -> None:
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.applied = 0
+        self._claim = True
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_group(self) -> None:
+        try:
+            await storage.redis.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _over_delivered(self, ids: list[str]) -> set[str]:
+        """Those of ``ids`` (in stream order) delivered more than ``MAX_DELIVERIES`` times."""
+        rows = await storage.redis.xpending_range(
+            STREAM_KEY, GROUP, min=ids[0], max=ids[-1], count=len(ids), consumername=self.consumer,
+        )
+        return {row["message_id"] for row in rows if row["times_delivered"] > MAX_DELIVERIES}
+
+    async def _apply(self, entries: list, retried: bool = False) -> int:
+        """Apply and acknowledge ``entries``; return the number handled.
+
+        ``retried`` entries were delivered before, so their applied-markers
+        and delivery counts are checked first.
+        """
+        r = storage.redis
+        fields = dict(entries)
+        seen: set[str] = set()
+        over: set[str] = set()
+        if retried:
+            markers = await r.mget([applied_key(entry_id) for entry_id in fields])
+            seen = {entry_id for entry_id, marker in zip(fields, markers) if marker}
+            over = await self._over_delivered(list(fields))
+        done = list(seen)
+        # entry id -> why it goes to the dead-letter stream
+        dead: dict[str, str] = {}
+        events = []
+        # (uid, day) -> ids of its entries
+        groups: dict[tuple[int, str], list[str]] = {}
+        for entry_id, raw in entries:
+            if entry_id in seen:
+                continue
+            if entry_id in over:
+                dead[entry_id] = f"delivered more than {MAX_DELIVERIES} times"
+                continue
+            if raw is None:
+                # XAUTOCLAIM returns entries trimmed by MAXLEN with no fields
+                logging.warning("Skipping event %s trimmed from the stream", entry_id)
+                done.append(entry_id)
+                continue
+            try:
+                event = Event.decode(raw)
+            except (KeyError, TypeError, ValueError) as e:
+                dead[entry_id] = f"malformed: {e!r}"
+                continue
+            events.append(event)
+            groups.setdefault((event.uid, event.day), []).append(entry_id)
+        applied = 0
+        if events:
+            async with r.pipeline(transaction=True) as pipe:
+                spans = {}
+                for (uid, day), delta in event_log.merge(events).items():
+                    start = len(pipe)
+                    await stats.queue_delta(pipe, uid, day, delta)
+                    spans[(uid, day)] = (start, len(pipe))
+                    for entry_id in groups[(uid, day)]:
+                        pipe.set(applied_key(entry_id), 1, ex=APPLIED_TTL)
+                results = await pipe.execute(raise_on_error=False)
+            for key, (start, end) in spans.items():
+                error = next((res for res in results[start:end] if isinstance(res, Exception)), None)
+                if error is None:
+                    done += groups[key]
+                    applied += len(groups[key])
+                else:
+                    logging.error("Events of user %s on %s partly applied: %s", *key, error)
+                    dead.update((entry_id, str(error)) for entry_id in groups[key])
+        await self._finish(done, dead, fields)
+        self.applied += applied
+        return len(entries)
+
+    async def _finish(self, done: list[str], dead: dict[str, str], fields: dict) -> None:
+        """XACK ``done`` and ``dead``, copying ``dead`` to the dead-letter stream."""
+        ids = [*done, *dead]
+        if not ids:
+            return
+        if dead:
+            logging.warning("Moving %d events to %s", len(dead), DEAD_KEY)
+        async with storage.redis.pipeline(transaction=True) as pipe:
+            for entry_id, reason in dead.items():
+                entry = {**(fields[entry_id] or {}), "id": entry_id, "error": reason}
+                pipe.xadd(DEAD_KEY, entry, maxlen=DEAD_MAXLEN, approximate=True)
+            pipe.xack(STREAM_KEY, GROUP, *ids)
+            pipe.delete(*(applied_key(entry_id) for entry_id in ids))
+            await pipe.execute()
+
+    async def _claimed(self) -> list:
+        if not self._claim:
+            return []
+        try:
+            _, entries, *_ = await storage.redis.xautoclaim(
+                STREAM_KEY, GROUP, self.consumer, CLAIM_IDLE_MS, "0-0", count=BATCH,
+            )
+        except ResponseError:
+            # XAUTOCLAIM needs Redis 6.2; older servers only retry their own entries
+            self._claim = False
+            return []
+        return entries
+
+    async def _read(self, entry_id: str, block: Optional[int]) -> list:
+        rows = await storage.redis.xreadgroup(
+            GROUP, self.consumer, {STREAM_KEY: entry_id}, count=BATCH, block=block,
+        )
+        return rows[0][1] if rows else []
+
+    async def step(self, block: Optional[int] = BLOCK_MS) -> int:
+        """Apply one batch; return the number of events handled."""
+        entries = await self._claimed()
+        if entries:
+            return await self._apply(entries, retried=True)
+        entries = await self._read(">", block)
+        return await self._apply(entries) if entries else 0
+
+    async def drain(self) -> None:
+        while await self.step(block=None):
+            pass
+
+    async def run(self) -> None:
+        await self.ensure_group()
+        # entries this consumer read but didn't acknowledge before a restart
+        last = "0"
+        try:
+            while entries := await self._read(last, None):
+                await self._apply(entries, retried=True)
+                last = entries[-1][0]
+        except Exception:
+            logging.exception("Replaying pending events failed")
+        while not self._closing:
+            try:
+                await self.step()
+            except Exception:
+                logging.exception("Aggregating events failed")
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def close(self) -> None:
+        """Stop after the current batch and apply what's already in the stream."""
+        self._closing = True
+        if self._task is not None:
+            await asyncio.wait({self._task})
+            self._task = None
+        try:
+            await self.drain()
+        except Exception:
+            logging.exception("Draining the event stream failed")
+
+
+async def _main(consumer: Optional[str]) -> None:
+    await storage.connect(os.getenv("REDIS_URL", storage.DEFAULT_URL))
+    if not event_log.stream_enabled():
+        raise SystemExit("The aggregator needs Redis")
+    worker = Aggregator(consumer)
+    logging.info("Aggregator %s started", worker.consumer)
+    try:
+        await worker.run()
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s — %(levelname)s — %(message)s")
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else None))
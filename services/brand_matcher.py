@@ -0,0 +1,77 @@
+"""Brand lookup by name or alias, built once from the catalog."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from rapidfuzz import fuzz, process
+
+# Typo tolerance: only fairly close spellings of reasonably long words count.
+FUZZY_MIN_LENGTH = 4
+FUZZY_CUTOFF = 80
+FUZZY_LIMIT = 5
+
+
+def normalize(text: str) -> str:
+    """Return lowercased text without spaces or punctuation for matching."""
+    return "".join(ch.lower() for ch in text or "" if ch.isalnum())
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@dataclass(frozen=True)
+class BrandMatch:
+    normalized: str
+    brand: Optional[str] = None
+    candidates: list[str] = field(default_factory=list)
+
+
+class BrandMatcher:
+    """Exact, partial and typo-tolerant matching over pre-normalized aliases."""
+
+    def __init__(self, brands: dict[str, Iterable[str]]) -> None:
+        # normalized alias -> canonical brand name, in catalog order
+        self.aliases: dict[str, str] = {}
+        for name, aliases in brands.items():
+            self.aliases.setdefault(normalize(name), name)
+            for alias in aliases:
+                self.aliases.setdefault(normalize(alias), name)
+        self.order = {name: i for i, name in enumerate(brands)}
+        self.grams: dict[str, set[str]] = {}
+        for alias in self.aliases:
+            for gram in _trigrams(alias):
+                self.grams.setdefault(gram, set()).add(alias)
+        self._choices = list(self.aliases)
+
+    def exact(self, normalized: str) -> Optional[str]:
+        return self.aliases.get(normalized)
+
+    def partial(self, normalized: str) -> list[str]:
+        """Brands whose name or alias contains the text, or is a near miss of it."""
+        if len(normalized) < 3:
+            hits = [a for a in self._choices if normalized in a]
+        else:
+            postings = sorted((self.grams.get(g, set()) for g in _trigrams(normalized)), key=len)
+            pool = set.intersection(*postings) if postings[0] else set()
+            hits = [a for a in pool if normalized in a]
+        # prefix hits first, then by catalog order
+        hits.sort(key=lambda a: (not a.startswith(normalized), self.order[self.aliases[a]]))
+        brands = [self.aliases[a] for a in hits]
+        if not brands and len(normalized) >= FUZZY_MIN_LENGTH:
+            found = process.extract(
+                normalized, self._choices, scorer=fuzz.ratio,
+                score_cutoff=FUZZY_CUTOFF, limit=FUZZY_LIMIT,
+            )
+            brands = [self.aliases[alias] for alias, _, _ in found]
+        return list(dict.fromkeys(brands))
+
+    def match(self, text: str) -> BrandMatch:
+        normalized = normalize(text)
+        if not normalized:
+            return BrandMatch(normalized)
+        brand = self.exact(normalized)
+        if brand:
+            return BrandMatch(normalized, brand)
+        return BrandMatch(normalized, candidates=self.partial(normalized))
@@ -0,0 +1,103 @@
+"""Brand catalog loaded from ``data/brands.json``.
+
+The file lists categories in menu order; each has a menu ``button``, the
+``prompt`` shown above its brand keyboard and its ``brands`` — ``name``,
+``photo`` (Telegram file_id), ``caption`` (HTML) and ``aliases`` used for
+lookup. Everything derived from it (brand keyboards, the brand matcher)
+is built in :func:`load`, so a reload swaps one :class:`Catalog` object.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Optional
+
+from aiogram.types import ReplyKeyboardMarkup
+
+from services.brand_matcher import BrandMatcher
+from services.keyboards import kb
+
+CATALOG_PATH = os.getenv(
+    "BRANDS_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "brands.json")
+)
+BACK_TO_CATEGORIES = "Назад к категориям"
+
+
+class CatalogError(ValueError):
+    pass
+
+
+class Brand:
+    __slots__ = ("name", "category", "photo", "caption", "aliases")
+
+    def __init__(self, name: str, category: str, photo: str, caption: str, aliases: tuple[str, ...]) -> None:
+        self.name = name
+        self.category = category
+        self.photo = photo
+        self.caption = caption
+        self.aliases = aliases
+
+
+class Category:
+    __slots__ = ("name", "button", "prompt", "brands", "keyboard")
+
+    def __init__(self, name: str, button: str, prompt: str, brands: tuple[str, ...]) -> None:
+        self.name = name
+        self.button = button
+        self.prompt = prompt
+        self.brands = brands
+        self.keyboard: ReplyKeyboardMarkup = kb(*brands, BACK_TO_CATEGORIES, width=2)
+
+
+class Catalog:
+    __slots__ = ("brands", "categories", "by_button", "matcher", "menu")
+
+    def __init__(self, categories: list[Category], brands: dict[str, Brand]) -> None:
+        self.categories = {c.name: c for c in categories}
+        self.by_button = {c.button: c for c in categories}
+        self.brands = brands
+        self.matcher = BrandMatcher({b.name: b.aliases for b in brands.values()})
+        self.menu: ReplyKeyboardMarkup = kb(*(c.button for c in categories), "Назад", width=2)
+
+    def keyboard_for(self, brand: Brand) -> ReplyKeyboardMarkup:
+        return self.categories[brand.category].keyboard
+
+
+def require(item: dict, field: str, where: str, error: type[ValueError] = CatalogError) -> str:
+    """Return ``item[field]`` if it is a non-empty string, else raise ``error``."""
+    value = item.get(field)
+    if not isinstance(value, str) or not value:
+        raise error(f"{where}: '{field}' must be a non-empty string")
+    return value
+
+
+def parse(data: dict) -> Catalog:
+    """Build a catalog from the decoded JSON, rejecting malformed entries."""
+    categories: list[Category] = []
+    brands: dict[str, Brand] = {}
+    for i, raw in enumerate(data.get("categories") or []):
+        where = f"categories[{i}]"
+        name = require(raw, "name", where)
+        names = []
+        for j, item in enumerate(raw.get("brands") or []):
+            brand_where = f"{where}.brands[{j}]"
+            brand = Brand(
+                require(item, "name", brand_where),
+                name,
+                require(item, "photo", brand_where),
+                require(item, "caption", brand_where),
+                tuple(a for a in item.get("aliases", []) if isinstance(a, str) and a),
+            )
+            if brand.name in brands:
+                raise CatalogError(f"{brand_where}: duplicate brand {brand.name!r}")
+            brands[brand.name] = brand
+            names.append(brand.name)
+        categories.append(Category(name, require(raw, "button", where), require(raw, "prompt", where), tuple(names)))
+    if not brands:
+        raise CatalogError("catalog has no brands")
+    return Catalog(categories, brands)
+
+
+def load(path: Optional[str] = None) -> Catalog:
+    with open(path or CATALOG_PATH, "r", encoding="utf-8") as f:
+        return parse(json.load(f))
@@ -0,0 +1,75 @@
+"""Brand catalog reloads across replicas.
+
+``/reload_brands`` reloads ``data/brands.json`` in the replica that got the
+command and then writes a new value to ``catalog:version``. Every replica
+reads that key every ``CATALOG_CHECK_INTERVAL`` seconds and reloads its own
+copy of the file when the value changes, so all of them serve the new
+cards and matcher within that time. The file itself is not shared: every
+replica must see the same ``BRANDS_PATH`` contents (one image or a shared
+volume). Without Redis there is nothing to share and only the replica
+that got the command reloads.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import secrets
+from typing import Awaitable, Callable, Optional
+
+from services import storage
+
+VERSION_KEY = "catalog:version"
+CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "30"))
+
+# version this replica's catalog corresponds to
+_seen: Optional[str] = None
+_task: Optional[asyncio.Task] = None
+
+
+def shared() -> bool:
+    return not isinstance(storage.redis, storage.MemoryRedis)
+
+
+async def publish() -> None:
+    """Tell the other replicas to reload; call after reloading here."""
+    global _seen
+    version = secrets.token_hex(8)
+    await storage.redis.set(VERSION_KEY, version)
+    _seen = version
+
+
+async def check(reload: Callable[[], Awaitable[None]]) -> bool:
+    """Reload if another replica published a new version; return whether it did."""
+    global _seen
+    version = await storage.redis.get(VERSION_KEY)
+    if version == _seen:
+        return False
+    await reload()
+    _seen = version
+    return True
+
+
+async def _watch(reload: Callable[[], Awaitable[None]]) -> None:
+    global _seen
+    # the catalog loaded at startup is the current one
+    _seen = await storage.redis.get(VERSION_KEY)
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        try:
+            if await check(reload):
+                logging.info("Brand catalog reloaded after a reload on another replica")
+        except Exception:
+            logging.exception("Brand catalog reload from %s failed", VERSION_KEY)
+
+
+def start(reload: Callable[[], Awaitable[None]]) -> None:
+    global _task
+    stop()
+    if shared():
+        _task = asyncio.ensure_future(_watch(reload))
+
+
+def stop() -> None:
+    if _task is not None and not _task.done():
+        _task.cancel()
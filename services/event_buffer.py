@@ -0,0 +1,121 @@
+"""Write-behind buffer for activity events.
+
+Handlers record brand views, results and AI-live questions with the
+synchronous methods of :class:`EventBuffer` and carry on; nothing waits
+for Redis. Queued events are published (see :mod:`services.event_log`)
+as one pipeline every ``STATS_FLUSH_INTERVAL`` seconds, or as soon as
+``STATS_FLUSH_EVENTS`` events are waiting. A batch that fails is put back
+in front of the queue and retried with the next one, unless more than
+``STATS_MAX_PENDING`` events are queued. :meth:`EventBuffer.close` writes
+what is left on shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Optional
+
+from services import event_log, stats
+from services.event_log import Event
+
+FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "0.3"))
+FLUSH_EVENTS = int(os.getenv("STATS_FLUSH_EVENTS", "200"))
+MAX_PENDING = int(os.getenv("STATS_MAX_PENDING", "100000"))
+
+
+class EventBuffer:
+    def __init__(
+        self,
+        interval: float = FLUSH_INTERVAL,
+        max_events: int = FLUSH_EVENTS,
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        self.interval = interval
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self.pending: list[Event] = []
+        self.counters: Counter[str] = Counter()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def _record(self, kind: str, uid: int, **fields: object) -> None:
+        self.pending.append(
+            Event(kind, uid, stats.today(), stats.now_str(), {k: str(v) for k, v in fields.items()})
+        )
+        self.counters["queued"] += 1
+        if len(self.pending) >= self.max_events:
+            self._wakeup.set()
+
+    def brand_view(self, uid: int, brand: str, category: str) -> None:
+        self._record("brand", uid, brand=brand, category=category)
+
+    def test_result(self, uid: int, points: int) -> None:
+        self._record("test", uid, points=points)
+
+    def game_result(self, uid: int, game: str, points: int) -> None:
+        self._record("game", uid, game=game, points=points)
+
+    def ai_query(self, source: str) -> None:
+        """Count an AI-live question; neither the asker nor the text is kept."""
+        self._record("ai", event_log.ANONYMOUS, source=source)
+
+    async def best(self, uid: int, game: str) -> int:
+        """All-time best for ``game``, counting results not written yet."""
+        queued = max(
+            (
+                int(e.fields["points"]) for e in self.pending
+                if e.uid == uid and e.kind == "game" and e.fields["game"] == game
+            ),
+            default=0,
+        )
+        return max(queued, await stats.best_score(uid, game))
+
+    async def flush(self) -> None:
+        async with self._lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                await event_log.publish(batch)
+            except Exception:
+                logging.exception("Writing %d events failed", len(batch))
+                self._requeue(batch)
+                return
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+
+    def _requeue(self, batch: list[Event]) -> None:
+        if len(self.pending) + len(batch) > self.max_pending:
+            self.counters["dropped"] += len(batch)
+            return
+        self.pending[:0] = batch
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        # let a write in progress finish rather than cancel it
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {**self.counters, "queue_depth": len(self.pending)}
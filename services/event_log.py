@@ -0,0 +1,110 @@
+"""Activity events and the Redis Stream they are logged to.
+
+Every brand view, finished test, game score and AI-live question is an
+:class:`Event`. The bot appends events to the ``events`` stream, capped
+at about ``EVENT_STREAM_MAXLEN`` entries. The stats hashes, history
+counters and leaderboards are built from the stream by the ``aggregator``
+consumer group (:mod:`services.aggregator`), so new reports can replay
+the log instead of changing the write path.
+
+Without Redis (MemoryRedis) there is no stream and :func:`apply` folds the
+events into the stats keys directly.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from services import stats, storage
+
+STREAM_KEY = "events"
+STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "1000000"))
+GROUP = "aggregator"
+# events the aggregator could not apply, with the error
+DEAD_KEY = f"{STREAM_KEY}:dead"
+
+KINDS = ("brand", "test", "game", "ai")
+# uid of events that are counted but not tied to a user (AI-live questions)
+ANONYMOUS = 0
+
+
+@dataclass(slots=True)
+class Event:
+    kind: str
+    uid: int
+    # stats day (see stats.today) and time of the event
+    day: str
+    at: str
+    # brand/category, points, game/points or source
+    fields: dict[str, str] = field(default_factory=dict)
+
+    def encode(self) -> dict[str, str]:
+        return {"kind": self.kind, "uid": str(self.uid), "day": self.day, "at": self.at, **self.fields}
+
+    @classmethod
+    def decode(cls, raw: dict[str, str]) -> "Event":
+        raw = dict(raw)
+        kind = raw.pop("kind")
+        if kind not in KINDS:
+            raise ValueError(f"unknown event kind {kind!r}")
+        return cls(kind, int(raw.pop("uid")), raw.pop("day"), raw.pop("at"), raw)
+
+
+def stream_enabled() -> bool:
+    return not isinstance(storage.redis, storage.MemoryRedis)
+
+
+def merge(events: Iterable[Event]) -> dict[tuple[int, str], stats.Delta]:
+    """Fold events into one delta per user and day."""
+    deltas: dict[tuple[int, str], stats.Delta] = {}
+    for e in events:
+        delta = deltas.get((e.uid, e.day))
+        if delta is None:
+            delta = deltas[(e.uid, e.day)] = stats.Delta()
+        if e.kind == "brand":
+            delta.add_brand(e.fields["brand"], e.fields["category"], e.at)
+        elif e.kind == "test":
+            delta.add_test(int(e.fields["points"]), e.at)
+        elif e.kind == "game":
+            delta.add_game(e.fields["game"], int(e.fields["points"]), e.at)
+        else:
+            delta.events[e.kind] += 1
+    return deltas
+
+
+async def append(events: Iterable[Event]) -> None:
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        for e in events:
+            pipe.xadd(STREAM_KEY, e.encode(), maxlen=STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+
+
+async def apply(events: Iterable[Event]) -> None:
+    """Write the aggregates for ``events`` without going through the stream."""
+    await stats.write((uid, day, delta) for (uid, day), delta in merge(events).items())
+
+
+async def publish(events: list[Event]) -> None:
+    if stream_enabled():
+        await append(events)
+    else:
+        await apply(events)
+
+
+async def info() -> dict:
+    """Stream length and what the aggregator group has not handled yet."""
+    if not stream_enabled():
+        return {"stream": False}
+    r = storage.redis
+    length = await r.xlen(STREAM_KEY)
+    groups = {g["name"]: g for g in await r.xinfo_groups(STREAM_KEY)} if length else {}
+    group = groups.get(GROUP, {})
+    return {
+        "stream": True,
+        "length": length,
+        "pending": group.get("pending", 0),
+        "lag": group.get("lag"),
+        "consumers": group.get("consumers", 0),
+        "dead": await r.xlen(DEAD_KEY),
+    }
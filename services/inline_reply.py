@@ -0,0 +1,104 @@
+"""Answering an update in the webhook HTTP response.
+
+Telegram accepts one Bot API call as the body of the webhook response,
+which saves an outbound request. With ``WEBHOOK_INLINE_REPLY=1`` main.py
+gives every update a :class:`ReplySlot` and waits up to
+``WEBHOOK_INLINE_WAIT`` seconds for the update to be handled:
+
+* a ``sendMessage`` is not sent but held in the slot, and the handler gets
+  a placeholder :class:`Message` (``message_id`` 0) — handlers must not
+  rely on the sent message. Other calls, ``sendPhoto`` included, are made
+  right away: their callers react to errors (``media.send_photo`` falls
+  back to uploading the file when a file_id is rejected), which a held
+  call would never report;
+* any later call first sends the held one, so the order is kept;
+* if the update finished in time, the held call becomes the response
+  body; otherwise the slot is closed and the held call is sent normally.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import InputFile
+from aiohttp import MultipartWriter
+
+from services.send_queue import placeholder_message
+
+INLINE_REPLY = os.getenv("WEBHOOK_INLINE_REPLY", "0") == "1"
+INLINE_WAIT = float(os.getenv("WEBHOOK_INLINE_WAIT", "1"))
+
+
+class ReplySlot:
+    def __init__(self) -> None:
+        self.method: Optional[TelegramMethod] = None
+        self.closed = False
+        self._send: Optional[tuple[NextRequestMiddlewareType, Bot]] = None
+        self._lock = asyncio.Lock()
+        self._finished = asyncio.Event()
+        self._flush: Optional[asyncio.Future] = None
+
+    def hold(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> None:
+        self.method = method
+        self._send = (make_request, bot)
+
+    async def release(self) -> None:
+        """Send the held call, if any, through the normal session."""
+        async with self._lock:
+            method, self.method = self.method, None
+            if method is not None:
+                make_request, bot = self._send
+                await make_request(bot, method)
+
+    def finish(self) -> None:
+        self._finished.set()
+
+    async def wait(self, timeout: float = INLINE_WAIT) -> Optional[TelegramMethod]:
+        """Return the call to answer with, or None to answer with an empty body."""
+        try:
+            await asyncio.wait_for(self._finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.closed = True
+        if self._finished.is_set():
+            method, self.method = self.method, None
+            return method
+        # still running: whatever is held goes out the normal way
+        self._flush = asyncio.ensure_future(self.release())
+        return None
+
+
+current_slot: ContextVar[Optional[ReplySlot]] = ContextVar("current_slot", default=None)
+
+
+class InlineReplyMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        slot = current_slot.get()
+        if slot is None:
+            return await make_request(bot, method)
+        await slot.release()
+        if not slot.closed and type(method) is SendMessage:
+            slot.hold(make_request, bot, method)
+            return placeholder_message(method)
+        return await make_request(bot, method)
+
+
+def build_reply(bot: Bot, method: TelegramMethod) -> MultipartWriter:
+    """Serialize ``method`` as a webhook response body."""
+    writer = MultipartWriter("form-data", boundary=f"webhookBoundary{secrets.token_urlsafe(16)}")
+    payload = writer.append(method.__api_method__)
+    payload.set_content_disposition("form-data", name="method")
+    files: Dict[str, InputFile] = {}
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files)
+        if not value:
+            continue
+        payload = writer.append(value)
+        payload.set_content_disposition("form-data", name=key)
+    return writer
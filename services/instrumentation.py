@@ -0,0 +1,92 @@
+"""Middlewares that feed :mod:`services.metrics`.
+
+* :class:`UpdateMetricsMiddleware` (outer, on ``dp.update``) counts updates
+  by type and outcome, times them and tracks how many are in flight.
+* :class:`HandlerMetricsMiddleware` (inner, on the dispatcher's message and
+  callback observers, so it sees every router) labels calls and timings
+  with the router and handler that took the event.
+* :class:`ApiMetricsMiddleware` (Bot session) times Bot API requests by
+  method. Registered after the send scheduler, it measures the request
+  itself rather than the time spent waiting for a send slot.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from services import metrics
+
+UPDATES = metrics.Counter("bot_updates_total", "Updates fed to the dispatcher", ("type", "status"))
+UPDATE_SECONDS = metrics.Histogram("bot_update_seconds", "Time to handle an update", ("type",))
+IN_FLIGHT = metrics.Gauge("bot_updates_in_flight", "Updates being handled")
+HANDLER_CALLS = metrics.Counter(
+    "bot_handler_calls_total", "Handler calls", ("router", "handler", "status"),
+)
+HANDLER_SECONDS = metrics.Histogram("bot_handler_seconds", "Handler run time", ("router", "handler"))
+API_REQUESTS = metrics.Counter("bot_api_requests_total", "Bot API requests", ("method", "status"))
+API_SECONDS = metrics.Histogram("bot_api_request_seconds", "Bot API request time", ("method",))
+
+
+def handler_name(callback: Callable) -> str:
+    return getattr(callback, "__name__", type(callback).__name__)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        kind = event.event_type
+        status = "error"
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            status = "unhandled" if result is UNHANDLED else "handled"
+            return result
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, kind)
+            UPDATES.inc(kind, status)
+            IN_FLIGHT.inc(amount=-1)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        router = data["event_router"].name
+        name = handler_name(data["handler"].callback)
+        status = "error"
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, router, name)
+            HANDLER_CALLS.inc(router, name, status)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        name = method.__api_method__
+        status = "error"
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+            status = "ok"
+            return result
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+            API_REQUESTS.inc(name, status)
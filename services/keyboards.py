@@ -0,0 +1,60 @@
+"""Reply keyboards built once and shared between messages.
+
+Markups are never modified after creation, so one instance can be sent
+to any number of chats. Static menus are module constants in bot.py;
+quiz questions draw from :class:`ShuffledLayouts`.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from random import choice, shuffle
+from typing import Callable, Hashable, Sequence
+
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+from aiogram.utils.keyboard import ReplyKeyboardBuilder
+
+# Pre-shuffled answer layouts kept per question
+LAYOUTS = 4
+
+
+def kb(*labels: str, width: int = 2) -> ReplyKeyboardMarkup:
+    builder = ReplyKeyboardBuilder()
+    for text in labels:
+        builder.add(KeyboardButton(text=text))
+    builder.adjust(width)
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=256)
+def column_kb(labels: tuple[str, ...]) -> ReplyKeyboardMarkup:
+    """One button per row; cached because the same lists come up repeatedly."""
+    return kb(*labels, width=1)
+
+
+class ShuffledLayouts:
+    """A few shuffled answer keyboards per question, built on first use.
+
+    ``make`` returns the answer labels for one layout; it is called once per
+    layout, so it may itself pick random distractors. ``tail`` buttons (e.g.
+    "main menu") stay at the bottom.
+    """
+
+    def __init__(self, *tail: str, variants: int = LAYOUTS, width: int = 1) -> None:
+        self.tail = tail
+        self.variants = variants
+        self.width = width
+        self._layouts: dict[Hashable, list[ReplyKeyboardMarkup]] = {}
+
+    def pick(self, key: Hashable, make: Callable[[], Sequence[str]]) -> ReplyKeyboardMarkup:
+        layouts = self._layouts.get(key)
+        if layouts is None:
+            layouts = self._layouts[key] = [self._build(make) for _ in range(self.variants)]
+        return choice(layouts)
+
+    def _build(self, make: Callable[[], Sequence[str]]) -> ReplyKeyboardMarkup:
+        labels = list(make())
+        shuffle(labels)
+        return kb(*labels, *self.tail, width=self.width)
+
+    def clear(self) -> None:
+        self._layouts.clear()
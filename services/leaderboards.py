@@ -0,0 +1,58 @@
+"""Top-N lists kept in Redis sorted sets.
+
+The sets are updated inside the same pipelines that write the stats hashes
+(see services.stats), so reading a top list is a single ZREVRANGE. Rebuild
+them from the stats hashes with ``python -m services.stats backfill``.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from services import storage
+
+BOARDS = ("best_blitz", "tests", "brands", "points")
+
+# Store the brand and, if the user hadn't seen it yet, bump their distinct-brands score.
+BRAND_VIEW_LUA = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('ZINCRBY', KEYS[2], 1, ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def _brand_view(store, keys, args) -> int:
+    brands = store.hashes.setdefault(keys[0], {})
+    if args[0] in brands:
+        return 0
+    brands[args[0]] = str(args[1])
+    board = store.zsets.setdefault(keys[1], {})
+    board[str(args[2])] = board.get(str(args[2]), 0.0) + 1
+    return 1
+
+
+brand_view = storage.Script(BRAND_VIEW_LUA, _brand_view)
+
+
+def board_key(board: str) -> str:
+    return f"leaderboard:{board}"
+
+
+async def add_brand(pipe, brands_key: str, uid: int, brand: str, category: str) -> None:
+    await brand_view([brands_key, board_key("brands")], [brand, category, uid], client=pipe)
+
+
+def add_points(pipe, uid: int, tests: int, points: int, best_blitz: Optional[int] = None) -> None:
+    if tests:
+        pipe.zincrby(board_key("tests"), tests, uid)
+    if points:
+        pipe.zincrby(board_key("points"), points, uid)
+    if best_blitz is not None:
+        pipe.zadd(board_key("best_blitz"), {uid: best_blitz}, gt=True)
+
+
+async def top(board: str, offset: int = 0, limit: int = 10) -> list[tuple[int, int]]:
+    """Return ``(uid, score)`` pairs for one page of the board, best first."""
+    rows = await storage.redis.zrevrange(board_key(board), offset, offset + limit - 1, withscores=True)
+    return [(int(uid), int(score)) for uid, score in rows]
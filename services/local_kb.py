@@ -0,0 +1,104 @@
+"""In-process brand knowledge base for the AI-live mode.
+
+Entries are looked up by normalized text (lowercase words separated by
+single spaces). :meth:`LocalKB.lookup` answers only when the text is
+about the entry as a whole:
+
+1. the whole text is a known alias;
+2. every word of some alias occurs in the text and those words make up at
+   least ``TOKEN_COVERAGE`` of it (the token index narrows the aliases to
+   check) — the longest such alias wins;
+3. the whole text, if it is one to three words, is a close spelling of an
+   alias.
+
+Anything else, such as a question that merely contains an alias ("какой
+курс доллара"), goes to the network; :meth:`LocalKB.stats` reports how
+often that was avoided.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from rapidfuzz import fuzz, process
+
+FUZZY_MIN_LENGTH = 4
+FUZZY_CUTOFF = 85
+# Longest query compared against aliases when fuzzy matching
+FUZZY_WINDOW = 3
+# Share of the query's words an alias must account for to answer it
+TOKEN_COVERAGE = 0.6
+
+
+@dataclass(slots=True)
+class KBEntry:
+    title: str
+    summary: str = ""
+    # set for competitor brands: the brand of ours to offer instead
+    our_alt: Optional[str] = None
+    # set for our own brands: sends the brand card
+    show: Optional[Callable[[Any], Awaitable[Any]]] = None
+
+
+class LocalKB:
+    def __init__(self) -> None:
+        self.entries: list[KBEntry] = []
+        # normalized alias -> entry index
+        self.aliases: dict[str, int] = {}
+        # word -> aliases containing it
+        self.postings: dict[str, set[str]] = {}
+        self._choices: list[str] = []
+        self.counters: Counter[str] = Counter()
+
+    def add(self, entry: KBEntry, aliases: Iterable[str]) -> None:
+        """Register ``entry`` under already normalized ``aliases``."""
+        idx = len(self.entries)
+        self.entries.append(entry)
+        for alias in aliases:
+            if not alias or alias in self.aliases:
+                continue
+            self.aliases[alias] = idx
+            for word in alias.split():
+                self.postings.setdefault(word, set()).add(alias)
+        self._choices = list(self.aliases)
+
+    def _by_tokens(self, words: list[str]) -> Optional[str]:
+        present = set(words)
+        candidates = set()
+        for word in present:
+            candidates |= self.postings.get(word, set())
+        hits = [
+            a for a in candidates
+            if present.issuperset(a.split()) and len(a.split()) >= TOKEN_COVERAGE * len(present)
+        ]
+        return max(hits, key=lambda a: (len(a.split()), len(a)), default=None)
+
+    def _fuzzy(self, text: str) -> Optional[str]:
+        if len(text) < FUZZY_MIN_LENGTH or len(text.split()) > FUZZY_WINDOW:
+            return None
+        found = process.extractOne(text, self._choices, scorer=fuzz.ratio, score_cutoff=FUZZY_CUTOFF)
+        return found[0] if found else None
+
+    def lookup(self, key: str) -> Optional[KBEntry]:
+        """Find the entry normalized text ``key`` is about."""
+        self.counters["lookups"] += 1
+        alias, kind = (key, "exact") if key in self.aliases else (None, "")
+        if alias is None and key:
+            alias, kind = self._by_tokens(key.split()), "token"
+            if alias is None:
+                alias, kind = self._fuzzy(key), "fuzzy"
+        if alias is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters[f"{kind}_hits"] += 1
+        return self.entries[self.aliases[alias]]
+
+    def stats(self) -> dict:
+        lookups = self.counters["lookups"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self.entries),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
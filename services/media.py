@@ -0,0 +1,150 @@
+"""Telegram file_ids of the brand card photos.
+
+* ``media:file_id`` — hash ``brand -> file_id``; an entry overrides the
+  photo from the catalog. An admin sets it by sending the photo to the bot
+  with the brand name as the caption.
+
+On startup :func:`start` runs a warm-up pass in the background: every
+photo in use is checked with ``getFile`` and the ones Telegram rejects are
+marked stale. A stale photo, or one that fails when sent, is uploaded from
+``MEDIA_DIR/<slug>.jpg`` if that file exists, and the file_id Telegram
+assigns to the upload is stored, so each file is uploaded once. Without a
+local file the card goes out as text.
+
+Every replica keeps a copy of the hash and reads it again once it is
+``MEDIA_TTL`` seconds old, so a file_id stored by another replica is used
+here within that time and clears this replica's stale mark.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import FSInputFile, Message, ReplyKeyboardMarkup
+
+from services import storage
+
+MEDIA_KEY = "media:file_id"
+MEDIA_DIR = os.getenv(
+    "MEDIA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "media")
+)
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MEDIA_TTL = float(os.getenv("MEDIA_TTL", "30"))
+
+# brand -> file_id set by an admin or recorded after an upload
+_file_ids: dict[str, str] = {}
+# monotonic time _file_ids was read from Redis
+_loaded_at = float("-inf")
+# brands whose file_id Telegram no longer accepts
+stale: set[str] = set()
+# brand -> failed sends, to see which media Telegram serves badly
+failures: Counter[str] = Counter()
+counters: Counter[str] = Counter()
+_warm_up: Optional[asyncio.Task] = None
+
+
+def slug(name: str) -> str:
+    return re.sub(r"\W+", "-", name.lower()).strip("-")
+
+
+def local_file(name: str) -> Optional[str]:
+    base = os.path.join(MEDIA_DIR, slug(name))
+    for ext in MEDIA_EXTENSIONS:
+        if os.path.isfile(base + ext):
+            return base + ext
+    return None
+
+
+async def file_id(name: str, default: str) -> str:
+    if time.monotonic() - _loaded_at >= MEDIA_TTL:
+        await load()
+    return _file_ids.get(name, default)
+
+
+async def load() -> None:
+    global _file_ids, _loaded_at
+    fresh = await storage.redis.hgetall(MEDIA_KEY)
+    # a new file_id, e.g. uploaded by another replica, replaces the stale one
+    stale.difference_update(name for name, value in fresh.items() if _file_ids.get(name) != value)
+    _file_ids, _loaded_at = fresh, time.monotonic()
+
+
+async def remember(name: str, new_id: str) -> None:
+    await storage.redis.hset(MEDIA_KEY, name, new_id)
+    _file_ids[name] = new_id
+    stale.discard(name)
+
+
+async def warm_up(bot: Bot, photos: dict[str, str]) -> None:
+    """Check every ``brand -> default file_id`` in ``photos`` with getFile."""
+    await load()
+    for name, default in photos.items():
+        try:
+            await bot.get_file(await file_id(name, default))
+        except TelegramBadRequest as e:
+            stale.add(name)
+            logging.warning("Stale photo for %s: %s", name, e.message)
+        except TelegramAPIError as e:
+            counters["warm_up_errors"] += 1
+            logging.warning("Photo check for %s failed: %s", name, e)
+        else:
+            stale.discard(name)
+        counters["warm_up_checked"] += 1
+    logging.info("Media warm-up: %d photos, %d stale", len(photos), len(stale))
+
+
+def start(bot: Bot, photos: dict[str, str]) -> None:
+    global _warm_up
+    stop()
+    _warm_up = asyncio.ensure_future(warm_up(bot, photos))
+
+
+def stop() -> None:
+    if _warm_up is not None and not _warm_up.done():
+        _warm_up.cancel()
+
+
+async def _upload(m: Message, name: str, path: str, caption: str, reply_markup: ReplyKeyboardMarkup) -> Message:
+    result = await m.answer_photo(photo=FSInputFile(path), caption=caption, reply_markup=reply_markup)
+    counters["uploaded"] += 1
+    if result.photo:
+        await remember(name, result.photo[-1].file_id)
+    return result
+
+
+async def send_photo(
+    m: Message, name: str, default: str, caption: str, reply_markup: ReplyKeyboardMarkup,
+) -> Message:
+    """Answer with the photo of ``name``, falling back to the local file."""
+    photo = await file_id(name, default)
+    if name not in stale:
+        try:
+            result = await m.answer_photo(photo=photo, caption=caption, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            stale.add(name)
+            failures[name] += 1
+            logging.warning("Photo for %s rejected: %s", name, e.message)
+        else:
+            counters["sent"] += 1
+            return result
+    path = local_file(name)
+    if path is not None:
+        return await _upload(m, name, path, caption, reply_markup)
+    counters["text_only"] += 1
+    return await m.answer(caption, reply_markup=reply_markup)
+
+
+def metrics() -> dict:
+    return {
+        **counters,
+        "overrides": len(_file_ids),
+        "stale": sorted(stale),
+        "failures": dict(failures),
+    }
@@ -0,0 +1,164 @@
+"""In-process counters and histograms served in the Prometheus text format.
+
+Recording is a dict lookup and an addition (plus a bisect for histograms),
+so it is cheap enough for every update, Redis command and API call.
+Metrics are created once at import time::
+
+    REQUESTS = metrics.Counter("bot_requests_total", "Bot API calls", ("method", "status"))
+    REQUESTS.inc("sendMessage", "ok")
+
+Values kept elsewhere (cache counters, queue depths) are exported with
+:func:`collect`, which calls the function on every scrape; a state such as
+a circuit breaker's is exported with :class:`StateGauge`.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from bisect import bisect_left
+from typing import Callable, Iterator, Sequence
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Redis round trips are well under the default buckets
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_INVALID = re.compile(r"[^a-zA-Z0-9_:]")
+
+_registry: list["Metric"] = []
+_collectors: list[tuple[str, str, Callable[[], dict]]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+
+class StateGauge(Metric):
+    """``{name}{state="..."}``: 1 for the state ``source()`` reports, 0 for the others."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, states: Sequence[str], source: Callable[[], str]) -> None:
+        super().__init__(name, help, ("state",))
+        self.states = tuple(states)
+        self.source = source
+
+    @property
+    def values(self) -> dict[tuple, float]:
+        current = self.source()
+        return {(state,): float(state == current) for state in self.states}
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+def collect(prefix: str, help: str, source: Callable[[], dict]) -> None:
+    """Export every number in ``source()`` as the gauge ``{prefix}_{key}``.
+
+    Nested dicts are flattened (``{"latency": {"p50": ...}}`` becomes
+    ``{prefix}_latency_p50``); strings and ``None`` are skipped, export
+    those with :class:`StateGauge`.
+    """
+    _collectors.append((prefix, help, source))
+
+
+def _flatten(prefix: str, values: dict) -> Iterator[tuple[str, float]]:
+    for key, value in values.items():
+        name = _INVALID.sub("_", f"{prefix}_{key}")
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            yield name, float(value)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _registry:
+        if metric.values:
+            lines.extend(metric.render())
+    for prefix, help, source in _collectors:
+        try:
+            values = source()
+        except Exception:
+            logging.exception("Collecting %s metrics failed", prefix)
+            continue
+        for name, value in _flatten(prefix, values):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,42 @@
+"""Dispatcher middlewares shared by the routers in bot.py."""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from services.brand_matcher import BrandMatcher
+from services.sessions import Session
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Compute per-message routing context once, before any filter runs.
+
+    Adds to handler data:
+
+    * ``session`` — the user's active :class:`Session` or None
+    * ``mode`` — its mode (quiz kind, ``"admin"``) or None
+    * ``brand_match`` — :class:`BrandMatch` for the text
+    """
+
+    def __init__(
+        self,
+        matcher: BrandMatcher,
+        load_session: Callable[[int], Awaitable[Optional[Session]]],
+    ) -> None:
+        self.matcher = matcher
+        self.load_session = load_session
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        match = self.matcher.match(event.text)
+        session = await self.load_session(event.from_user.id) if event.from_user else None
+        data["session"] = session
+        data["mode"] = session.mode if session else None
+        data["brand_match"] = match
+        return await handler(event, data)
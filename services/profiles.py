@@ -0,0 +1,313 @@
+"""User profiles (name, username, phone) stored as one Redis hash per user.
+
+``profile:{uid}`` holds ``username``, ``first_name``, ``last_name`` and
+``phone``; only fields that actually changed are written, together with
+the admin search indexes in the same pipeline:
+
+* ``idx:phone`` — hash ``+E164 phone -> uid``
+* ``idx:name:{gram}`` — sets of uids per 1–2 letter prefix and per trigram
+  of every first name, last name and username token
+* ``idx:tok:{token}`` — set of uids per whole token
+* ``idx:tokens`` — every token, in a zset ordered lexicographically for
+  prefix lookups; tokens nobody has any more are only dropped by ``reindex``
+
+:func:`search` ranks from the indexes: whole-token matches, then token
+prefixes, then substrings. Only the best ``MAX_CANDIDATES`` are fetched to
+be ordered by name, so a search costs three round trips however many
+users match.
+
+Profiles from the old ``user_info.json`` file are imported with
+``python -m services.profiles import [path]``; ``reindex`` rebuilds the
+search indexes from the stored profiles.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+from redis.exceptions import WatchError
+
+from services import storage
+
+FIELDS = ("username", "first_name", "last_name", "phone")
+NAME_FIELDS = ("username", "first_name", "last_name")
+PHONE_INDEX = "idx:phone"
+TOKENS_KEY = "idx:tokens"
+MAX_MATCHES = 20
+# Most candidates whose names are fetched to order one search's matches
+MAX_CANDIDATES = 200
+# Most tokens one query word is expanded to as a prefix
+MAX_PREFIX_TOKENS = 200
+# Sorts after every other character, as the end of a lexicographic prefix range
+_LEX_END = "\U0010ffff"
+
+
+def profile_key(uid: int | str) -> str:
+    return f"profile:{uid}"
+
+
+def token_key(token: str) -> str:
+    return f"idx:tok:{token}"
+
+
+def _clean(info: dict) -> dict:
+    # Redis can't store None; an empty string means "not set".
+    return {k: v for k, v in info.items() if v}
+
+
+def normalize_phone(phone: str) -> str:
+    """Return the phone in E.164 form, assuming +7 for local KZ/RU numbers."""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return f"+{digits}" if digits else ""
+
+
+def _fold(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def _split(text: str) -> list[str]:
+    return [t for t in re.split(r"[\s_.\-@]+", _fold(text)) if t]
+
+
+def _tokens(info: dict) -> set[str]:
+    return {t for field in NAME_FIELDS for t in _split(info.get(field))}
+
+
+def _grams(token: str) -> set[str]:
+    grams = {token[:1], token[:2]}
+    grams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+
+def _name_grams(info: dict) -> set[str]:
+    return {g for t in _tokens(info) for g in _grams(t)}
+
+
+def _index(pipe, uid: int | str, old: dict, new: dict) -> None:
+    """Queue index updates for a profile going from ``old`` to ``new``."""
+    old_grams, new_grams = _name_grams(old), _name_grams(new)
+    for gram in old_grams - new_grams:
+        pipe.srem(f"idx:name:{gram}", uid)
+    for gram in new_grams - old_grams:
+        pipe.sadd(f"idx:name:{gram}", uid)
+    old_tokens, new_tokens = _tokens(old), _tokens(new)
+    for token in old_tokens - new_tokens:
+        pipe.srem(token_key(token), uid)
+    for token in new_tokens - old_tokens:
+        pipe.sadd(token_key(token), uid)
+        pipe.zadd(TOKENS_KEY, {token: 0})
+    old_phone, new_phone = normalize_phone(old.get("phone")), normalize_phone(new.get("phone"))
+    if old_phone != new_phone:
+        if old_phone:
+            pipe.hdel(PHONE_INDEX, old_phone)
+        if new_phone:
+            pipe.hset(PHONE_INDEX, new_phone, uid)
+
+
+async def get(uid: int) -> dict:
+    return _clean(await storage.redis.hgetall(profile_key(uid)))
+
+
+async def get_many(uids: Iterable[int]) -> dict[int, dict]:
+    uids = list(uids)
+    if not uids:
+        return {}
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        for uid in uids:
+            pipe.hgetall(profile_key(uid))
+        rows = await pipe.execute()
+    return {uid: _clean(row) for uid, row in zip(uids, rows)}
+
+
+async def update(uid: int, **fields: Optional[str]) -> dict:
+    """Write the fields that differ from the stored profile; return the old one.
+
+    The profile is WATCHed while the index changes are worked out, so a
+    concurrent update (``ensure_user`` racing ``set_phone``) makes this one
+    start over instead of diffing the indexes against a stale profile.
+    """
+    key = profile_key(uid)
+    async with storage.redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                old = _clean(await pipe.hgetall(key))
+                changed = {k: v or "" for k, v in fields.items() if (v or None) != old.get(k)}
+                if not changed:
+                    return old
+                pipe.multi()
+                pipe.hset(key, mapping=changed)
+                _index(pipe, uid, old, _clean({**old, **changed}))
+                await pipe.execute()
+                return old
+            except WatchError:
+                continue
+
+
+async def ensure_user(u) -> None:
+    await update(u.id, username=u.username, first_name=u.first_name, last_name=u.last_name)
+
+
+async def set_phone(uid: int, phone: str) -> None:
+    await update(uid, phone=phone)
+
+
+async def find_by_phone(phone: str) -> Optional[int]:
+    uid = await storage.redis.hget(PHONE_INDEX, normalize_phone(phone))
+    return int(uid) if uid else None
+
+
+def _rank(query: str, info: dict) -> Optional[int]:
+    """0 — whole token, 1 — token prefix, 2 — substring, None — no match."""
+    tokens = _tokens(info)
+    if query in tokens:
+        return 0
+    if any(t.startswith(query) for t in tokens):
+        return 1
+    if any(query in _fold(info.get(field)) for field in NAME_FIELDS):
+        return 2
+    return None
+
+
+def _word_keys(word: str) -> list[str]:
+    if len(word) < 3:
+        return [f"idx:name:{word}"]
+    return [f"idx:name:{word[i:i + 3]}" for i in range(len(word) - 2)]
+
+
+async def _tiers(words: list[str]) -> list[set[int]]:
+    """Uids whose every word matches a whole token, a token prefix, a substring.
+
+    Each tier includes the ones before it. Substring matches come from the
+    trigram sets, so they are only candidates.
+    """
+    r = storage.redis
+    async with r.pipeline(transaction=False) as pipe:
+        for word in words:
+            pipe.smembers(token_key(word))
+            if len(word) < 3:
+                pipe.smembers(f"idx:name:{word}")
+            else:
+                pipe.zrangebylex(TOKENS_KEY, f"[{word}", f"[{word}{_LEX_END}", start=0, num=MAX_PREFIX_TOKENS)
+                pipe.sinter(*_word_keys(word))
+        rows = iter(await pipe.execute())
+    exact, prefix, grams, prefix_tokens = [], [], [], {}
+    for word in words:
+        exact.append({int(uid) for uid in next(rows)})
+        if len(word) < 3:
+            prefix.append({int(uid) for uid in next(rows)} | exact[-1])
+            grams.append(prefix[-1])
+        else:
+            prefix_tokens[len(prefix)] = next(rows)
+            prefix.append(exact[-1])
+            grams.append({int(uid) for uid in next(rows)})
+    if any(prefix_tokens.values()):
+        async with r.pipeline(transaction=False) as pipe:
+            for tokens in prefix_tokens.values():
+                pipe.sunion(*(token_key(t) for t in tokens or [""]))
+            for i, uids in zip(prefix_tokens, await pipe.execute()):
+                prefix[i] = prefix[i] | {int(uid) for uid in uids}
+    return [
+        set.intersection(*exact),
+        set.intersection(*prefix),
+        set.intersection(*(p | g for p, g in zip(prefix, grams))),
+    ]
+
+
+async def search(query: str, limit: int = MAX_MATCHES) -> list[int]:
+    """Find users by first name, last name or username, best matches first.
+
+    Every word of the query must match; words shorter than three letters
+    only match the start of a name.
+    """
+    words = _split(query)
+    if not words:
+        return []
+    candidates: list[int] = []
+    for tier in await _tiers(words):
+        # the earlier tiers are exact, so later ones can't make the cut
+        if len(candidates) >= limit:
+            break
+        seen = set(candidates)
+        candidates += sorted(uid for uid in tier if uid not in seen)[:MAX_CANDIDATES - len(candidates)]
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        for uid in candidates:
+            pipe.hmget(profile_key(uid), NAME_FIELDS)
+        rows = await pipe.execute()
+    ranked = []
+    for uid, row in zip(candidates, rows):
+        info = _clean(dict(zip(NAME_FIELDS, row)))
+        ranks = [_rank(word, info) for word in words]
+        if None not in ranks:
+            ranked.append((max(ranks), display_name(info, uid), uid))
+    ranked.sort()
+    return [uid for _, _, uid in ranked[:limit]]
+
+
+def display_name(info: dict, uid: int) -> str:
+    name = (info.get("first_name", "") + " " + info.get("last_name", "")).strip()
+    username = info.get("username")
+    if username:
+        username = f"@{username}"
+    else:
+        username = ""
+    return " ".join(part for part in [name, username] if part).strip() or f"id {uid}"
+
+
+async def import_json(path: str) -> int:
+    """Load profiles from the legacy user_info.json file.
+
+    Each row goes through :func:`update`, so profiles already stored are
+    diffed and their old index entries removed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for uid, info in data.items():
+        await update(int(uid), **{k: info.get(k) for k in FIELDS})
+    return len(data)
+
+
+async def reindex() -> int:
+    """Rebuild the search indexes from the stored profiles."""
+    r = storage.redis
+    for pattern in ("idx:name:*", token_key("*")):
+        async for key in r.scan_iter(pattern):
+            await r.delete(key)
+    await r.delete(PHONE_INDEX, TOKENS_KEY)
+    count = 0
+    async for key in r.scan_iter(profile_key("*")):
+        uid = key.split(":")[1]
+        async with r.pipeline(transaction=False) as pipe:
+            _index(pipe, uid, {}, await get(uid))
+            await pipe.execute()
+        count += 1
+    return count
+
+
+async def _cli(command: str, path: str) -> None:
+    await storage.connect(os.getenv("REDIS_URL", storage.DEFAULT_URL))
+    try:
+        if command == "import":
+            print(f"Imported {await import_json(path)} profiles from {path}")
+        elif command == "reindex":
+            print(f"Reindexed {await reindex()} profiles")
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    load_dotenv()
+    args = sys.argv[1:] or ["import"]
+    asyncio.run(_cli(args[0], args[1] if len(args) > 1 else "user_info.json"))
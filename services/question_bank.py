@@ -0,0 +1,136 @@
+"""Quiz and game questions loaded from ``data/questions.json``.
+
+The file has four sections: ``tests`` (a list of topics, each with its menu
+``button``), ``truth``, ``assoc`` and ``blitz``. A bank holds ``questions``
+(``text``, ``options``, ``answer``) and may give:
+
+* ``per_game`` — questions dealt per game (all of them by default);
+* ``options`` — shared answer options for questions without their own;
+* ``distractors`` — how many wrong options to draw from the pool set with
+  :meth:`Bank.set_pool` (the association game uses brand names).
+
+A game keeps only its deck — the shuffled question indexes from
+:meth:`Bank.deal` — in the session; question ``deck[step]`` is asked next.
+"""
+from __future__ import annotations
+
+import json
+import os
+from functools import partial
+from random import sample
+from typing import Iterable, Optional
+
+from services import catalog
+
+QUESTIONS_PATH = os.getenv(
+    "QUESTIONS_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "questions.json")
+)
+
+
+class QuestionBankError(ValueError):
+    pass
+
+
+_require = partial(catalog.require, error=QuestionBankError)
+
+
+class Question:
+    __slots__ = ("text", "options", "answer")
+
+    def __init__(self, text: str, options: tuple[str, ...], answer: str) -> None:
+        self.text = text
+        self.options = options
+        self.answer = answer
+
+
+class Bank:
+    __slots__ = ("name", "questions", "per_game", "distractors", "_pools")
+
+    def __init__(self, name: str, questions: tuple[Question, ...], per_game: int, distractors: int = 0) -> None:
+        self.name = name
+        self.questions = questions
+        self.per_game = per_game
+        self.distractors = distractors
+        # answer -> wrong options to draw from
+        self._pools: dict[str, tuple[str, ...]] = {}
+
+    def deal(self) -> list[int]:
+        """A fresh shuffled deck of ``per_game`` question indexes."""
+        return sample(range(len(self.questions)), self.per_game)
+
+    def set_pool(self, names: Iterable[str]) -> None:
+        """Precompute the distractors for every answer; all answers must be in ``names``."""
+        names = tuple(names)
+        missing = sorted({q.answer for q in self.questions} - set(names))
+        if missing:
+            raise QuestionBankError(f"{self.name}: answers not in the pool: {', '.join(missing)}")
+        if len(names) <= self.distractors:
+            raise QuestionBankError(f"{self.name}: pool is smaller than {self.distractors + 1}")
+        self._pools = {q.answer: tuple(n for n in names if n != q.answer) for q in self.questions}
+
+    def options(self, index: int) -> list[str]:
+        """Answer options of question ``index``; drawn anew for pool-based banks."""
+        q = self.questions[index]
+        if not self.distractors:
+            return list(q.options)
+        return [q.answer, *sample(self._pools[q.answer], self.distractors)]
+
+
+class QuestionBank:
+    __slots__ = ("tests", "by_button", "truth", "assoc", "blitz")
+
+    def __init__(self, tests: dict[str, tuple[str, Bank]], truth: Bank, assoc: Bank, blitz: Bank) -> None:
+        # topic -> (menu button, bank)
+        self.tests = {topic: bank for topic, (_, bank) in tests.items()}
+        self.by_button = {button: topic for topic, (button, _) in tests.items()}
+        self.truth = truth
+        self.assoc = assoc
+        self.blitz = blitz
+
+
+def _bank(name: str, raw: dict) -> Bank:
+    if not isinstance(raw, dict):
+        raise QuestionBankError(f"{name}: must be an object")
+    shared = tuple(raw.get("options") or ())
+    distractors = raw.get("distractors", 0)
+    questions = []
+    for i, item in enumerate(raw.get("questions") or []):
+        where = f"{name}.questions[{i}]"
+        text, answer = _require(item, "text", where), _require(item, "answer", where)
+        options = tuple(item.get("options") or shared)
+        if not distractors:
+            if answer not in options:
+                raise QuestionBankError(f"{where}: answer {answer!r} is not among the options")
+            if len(set(options)) != len(options):
+                raise QuestionBankError(f"{where}: duplicate options")
+        questions.append(Question(text, options, answer))
+    if not questions:
+        raise QuestionBankError(f"{name}: no questions")
+    per_game = raw.get("per_game", len(questions))
+    if not isinstance(per_game, int) or not 0 < per_game <= len(questions):
+        raise QuestionBankError(f"{name}: 'per_game' must be between 1 and {len(questions)}")
+    return Bank(name, tuple(questions), per_game, distractors)
+
+
+def parse(data: dict) -> QuestionBank:
+    """Build the banks from the decoded JSON, rejecting malformed entries."""
+    tests: dict[str, tuple[str, Bank]] = {}
+    for i, raw in enumerate(data.get("tests") or []):
+        where = f"tests[{i}]"
+        topic = _require(raw, "topic", where)
+        if topic in tests:
+            raise QuestionBankError(f"{where}: duplicate topic {topic!r}")
+        tests[topic] = (_require(raw, "button", where), _bank(f"tests.{topic}", raw))
+    if not tests:
+        raise QuestionBankError("no tests")
+    return QuestionBank(
+        tests,
+        _bank("truth", data.get("truth")),
+        _bank("assoc", data.get("assoc")),
+        _bank("blitz", data.get("blitz")),
+    )
+
+
+def load(path: Optional[str] = None) -> QuestionBank:
+    with open(path or QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        return parse(json.load(f))
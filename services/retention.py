@@ -0,0 +1,223 @@
+"""Retention of the daily stats keys.
+
+Daily keys get a TTL whenever they are written (see :mod:`services.stats`).
+Before they expire, :func:`rollup` adds every finished day of
+``history:daily:{day}`` into ``history:weekly:{YYYY-Www}`` and
+``history:monthly:{YYYY-MM}``. Events can reach a finished day late (the
+stream aggregator applies them after the fact), so for ``ROLLUP_GRACE_DAYS``
+a day is rolled up again on each pass: ``history:rolled:{day}`` holds the
+counts already added and only the difference goes in. After that the day
+joins ``history:rolled`` and is left alone. Each day is rolled in one
+WATCHed transaction, so repeated passes (or two bot processes) count
+every event once.
+
+:func:`expire_legacy` puts the TTL on daily keys written before TTLs
+existed and deletes the ones already past retention, adding up the memory
+that frees.
+
+The bot runs a pass every ``STATS_ROLLUP_INTERVAL`` seconds;
+``python -m services.retention`` runs one by hand.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from redis.exceptions import ResponseError, WatchError
+
+from services import stats, storage
+
+ROLLED_KEY = "history:rolled"
+ROLLUP_INTERVAL = int(os.getenv("STATS_ROLLUP_INTERVAL", "21600"))
+# days after which late events are no longer added to the rollups
+ROLLUP_GRACE_DAYS = int(os.getenv("STATS_ROLLUP_GRACE_DAYS", "2"))
+DAILY_PATTERNS = (stats.history_key("daily", "*"), "user:*:stats:daily:*")
+BATCH = 500
+
+_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+last_report: dict = {}
+_task: Optional[asyncio.Task] = None
+
+
+def week_of(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_of(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def recent(period: str, count: int) -> list[str]:
+    """Labels of the last ``count`` days, weeks or months, newest first."""
+    today = datetime.now(stats.TZ).date()
+    if period == "daily":
+        return [(today - timedelta(days=i)).isoformat() for i in range(count)]
+    if period == "weekly":
+        return [week_of(today - timedelta(weeks=i)) for i in range(count)]
+    labels = []
+    month = today.replace(day=1)
+    for _ in range(count):
+        labels.append(month_of(month))
+        month = (month - timedelta(days=1)).replace(day=1)
+    return labels
+
+
+def rolled_key(label: str) -> str:
+    return f"{ROLLED_KEY}:{label}"
+
+
+async def _roll_day(key: str, label: str, final: bool) -> bool:
+    """Add what ``key`` gained since the last pass; return whether anything did."""
+    day = date.fromisoformat(label)
+    done_key = rolled_key(label)
+    async with storage.redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key, done_key)
+                counts = await pipe.hgetall(key)
+                done = await pipe.hgetall(done_key)
+                deltas = {e: int(v) - int(done.get(e, 0)) for e, v in counts.items()}
+                deltas = {e: d for e, d in deltas.items() if d}
+                pipe.multi()
+                for event, delta in deltas.items():
+                    pipe.hincrby(stats.history_key("weekly", week_of(day)), event, delta)
+                    pipe.hincrby(stats.history_key("monthly", month_of(day)), event, delta)
+                if deltas:
+                    pipe.hset(done_key, mapping=counts)
+                    pipe.expire(done_key, stats.DAILY_TTL)
+                if final:
+                    pipe.sadd(ROLLED_KEY, label)
+                    pipe.delete(done_key)
+                await pipe.execute()
+                return bool(deltas)
+            except WatchError:
+                continue
+
+
+async def rollup() -> int:
+    """Add finished days into the weekly and monthly counters; return how many changed."""
+    r = storage.redis
+    today = stats.today()
+    final_before = (date.fromisoformat(today) - timedelta(days=ROLLUP_GRACE_DAYS)).isoformat()
+    finished = await r.smembers(ROLLED_KEY)
+    rolled = 0
+    async for key in r.scan_iter(stats.history_key("daily", "*")):
+        label = key.rsplit(":", 1)[-1]
+        # today is still being written to
+        if label >= today or label in finished:
+            continue
+        rolled += await _roll_day(key, label, label < final_before)
+    return rolled
+
+
+async def _sizes(keys: list[str]) -> list[int]:
+    try:
+        async with storage.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.memory_usage(key)
+            return [size or 0 for size in await pipe.execute()]
+    except ResponseError:
+        # MEMORY USAGE is disabled on some hosted Redis plans
+        return [0] * len(keys)
+
+
+async def _expire_batch(keys: list[str], report: dict) -> None:
+    r = storage.redis
+    async with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+    now = datetime.now(stats.TZ)
+    expired, expiring = [], {}
+    for key, ttl in zip(keys, ttls):
+        found = _DAY.search(key)
+        if ttl != -1 or not found:
+            continue
+        written = datetime.fromisoformat(found.group()).replace(tzinfo=stats.TZ) + timedelta(days=1)
+        left = stats.DAILY_TTL - int((now - written).total_seconds())
+        if left > 0:
+            expiring[key] = left
+        else:
+            expired.append(key)
+    if expired:
+        report["reclaimed_bytes"] += sum(await _sizes(expired))
+    async with r.pipeline(transaction=False) as pipe:
+        for key, left in expiring.items():
+            pipe.expire(key, left)
+        if expired:
+            pipe.delete(*expired)
+        await pipe.execute()
+    report["expiring"] += len(expiring)
+    report["deleted"] += len(expired)
+
+
+async def expire_legacy() -> dict:
+    """TTL daily keys that have none; delete those already past retention."""
+    report = {"expiring": 0, "deleted": 0, "reclaimed_bytes": 0}
+    for pattern in DAILY_PATTERNS:
+        keys: list[str] = []
+        async for key in storage.redis.scan_iter(pattern, count=BATCH):
+            keys.append(key)
+            if len(keys) >= BATCH:
+                await _expire_batch(keys, report)
+                keys = []
+        if keys:
+            await _expire_batch(keys, report)
+    return report
+
+
+async def run() -> dict:
+    global last_report
+    # roll up first: expire_legacy may delete old daily history
+    rolled = await rollup()
+    report = {"rolled_days": rolled, **await expire_legacy()}
+    logging.info(
+        "Stats retention: %d days rolled up, %d keys given a TTL, %d deleted (%d bytes)",
+        report["rolled_days"], report["expiring"], report["deleted"], report["reclaimed_bytes"],
+    )
+    last_report = {**report, "at": stats.now_str()}
+    return report
+
+
+async def _run_forever() -> None:
+    while True:
+        try:
+            await run()
+        except Exception:
+            logging.exception("Stats retention pass failed")
+        await asyncio.sleep(ROLLUP_INTERVAL)
+
+
+def start() -> None:
+    global _task
+    stop()
+    _task = asyncio.ensure_future(_run_forever())
+
+
+def stop() -> None:
+    if _task is not None and not _task.done():
+        _task.cancel()
+
+
+async def _cli() -> None:
+    await storage.connect(os.getenv("REDIS_URL", storage.DEFAULT_URL))
+    try:
+        report = await run()
+        print(
+            f"Rolled up {report['rolled_days']} days, set a TTL on {report['expiring']} keys, "
+            f"deleted {report['deleted']} keys ({report['reclaimed_bytes']} bytes)"
+        )
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(_cli())
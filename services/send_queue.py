@@ -0,0 +1,210 @@
+"""Outbound request scheduling for the bot session.
+
+:class:`SendScheduler` is a session request middleware: every Bot API
+call that targets a chat goes through it.
+
+* Calls to the same chat run one at a time, in the order they were made.
+* A global token bucket (``SEND_RATE`` per second) and a per-chat bucket
+  (``SEND_CHAT_RATE`` per second, bursts of ``SEND_CHAT_BURST``) keep the
+  bot under Telegram's flood limits.
+* On ``429 Too Many Requests`` the chat is paused for ``retry_after``
+  seconds and the call is repeated (up to ``SEND_MAX_RETRIES`` times).
+* With ``SEND_MERGE=1``, a plain text message (no keyboard, no reply) is
+  held for up to ``SEND_MERGE_WINDOW`` seconds; if the next call to the
+  chat is a text message too, both go out as one. The handler gets a
+  placeholder :class:`Message` (``message_id`` 0) for a held message.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+from services.cache import TTLCache
+
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "5"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+SEND_MERGE = os.getenv("SEND_MERGE", "0") == "1"
+SEND_MERGE_WINDOW = float(os.getenv("SEND_MERGE_WINDOW", "0.1"))
+MAX_TEXT_LENGTH = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def placeholder_message(method: TelegramMethod) -> Message:
+    """A stand-in result for a message that hasn't been sent yet."""
+    return Message(
+        message_id=0,
+        date=datetime.now(),
+        chat=Chat(id=int(method.chat_id), type="private"),
+        text=getattr(method, "text", None),
+        caption=getattr(method, "caption", None),
+    )
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        rate: float = SEND_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: int = SEND_CHAT_BURST,
+        merge: bool = SEND_MERGE,
+        merge_window: float = SEND_MERGE_WINDOW,
+    ) -> None:
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # an idle chat's bucket is full again long before it expires here
+        self.chat_buckets = TTLCache(10000, max(60.0, chat_burst / chat_rate))
+        self.merge = merge
+        self.merge_window = merge_window
+        # chat_id -> [lock, number of calls using it]
+        self._locks: dict[Any, list] = {}
+        # chat_id -> (held message, make_request, bot, flush timer)
+        self._held: dict[Any, tuple] = {}
+        self._flushes: set[asyncio.Task] = set()
+        self.counters: Counter[str] = Counter()
+
+    @asynccontextmanager
+    async def _chat_turn(self, chat_id: Any) -> AsyncIterator[None]:
+        entry = self._locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[chat_id]
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        # re-set on every use so the entry only expires once the chat is idle
+        self.chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    @staticmethod
+    def _mergeable(method: TelegramMethod) -> bool:
+        return (
+            type(method) is SendMessage
+            and method.reply_markup is None
+            and method.entities is None
+            and method.reply_to_message_id is None
+            and method.reply_parameters is None
+        )
+
+    @staticmethod
+    def _merge(held: SendMessage, method: TelegramMethod) -> Optional[SendMessage]:
+        if type(method) is not SendMessage or method.entities is not None or held.parse_mode != method.parse_mode:
+            return None
+        text = f"{held.text}\n\n{method.text}"
+        if len(text) > MAX_TEXT_LENGTH:
+            return None
+        return method.model_copy(update={"text": text})
+
+    async def _send(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        chat_bucket = self._chat_bucket(method.chat_id)
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            await chat_bucket.acquire()
+            await self.bucket.acquire()
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == SEND_MAX_RETRIES:
+                    raise
+                self.counters["retry_after"] += 1
+                logging.warning("Flood control in chat %s, retrying in %ss", method.chat_id, e.retry_after)
+                chat_bucket.pause(e.retry_after)
+                continue
+            self.counters["sent"] += 1
+            return result
+
+    async def _flush(self, chat_id: Any) -> None:
+        async with self._chat_turn(chat_id):
+            held = self._held.pop(chat_id, None)
+            if held is None:
+                return
+            method, make_request, bot, _ = held
+            try:
+                await self._send(make_request, bot, method)
+            except Exception:
+                logging.exception("Held message to chat %s failed", chat_id)
+
+    def _start_flush(self, chat_id: Any) -> None:
+        task = asyncio.ensure_future(self._flush(chat_id))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _hold(self, make_request: NextRequestMiddlewareType, bot: Bot, method: SendMessage) -> Message:
+        chat_id = method.chat_id
+        loop = asyncio.get_running_loop()
+        timer = loop.call_later(self.merge_window, self._start_flush, chat_id)
+        self._held[chat_id] = (method, make_request, bot, timer)
+        self.counters["held"] += 1
+        return placeholder_message(method)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        async with self._chat_turn(chat_id):
+            held = self._held.pop(chat_id, None)
+            if held is not None:
+                held_method, held_request, held_bot, timer = held
+                timer.cancel()
+                merged = self._merge(held_method, method)
+                if merged is not None:
+                    self.counters["merged"] += 1
+                    method = merged
+                else:
+                    await self._send(held_request, held_bot, held_method)
+            if self.merge and self._mergeable(method):
+                return self._hold(make_request, bot, method)
+            return await self._send(make_request, bot, method)
+
+    async def flush_all(self) -> None:
+        """Send every held message now (on shutdown)."""
+        for chat_id in list(self._held):
+            self._held[chat_id][3].cancel()
+            await self._flush(chat_id)
+
+    def metrics(self) -> dict:
+        return {**self.counters, "held_now": len(self._held), "busy_chats": len(self._locks)}
@@ -0,0 +1,121 @@
+"""Quiz, game and admin-prompt state, one short-lived record per user.
+
+A user has at most one active session. The record is a compact JSON array
+``[mode, step, score, answer, topic, choices, deck]`` and expires ``SESSION_TTL``
+seconds after the last answer, so abandoned games don't pile up:
+
+* with Redis it lives under ``session:{uid}`` (``SET ... EX``) and is shared
+  by every bot process;
+* without Redis it is kept in a process-local LRU capped at ``SESSION_MAX``
+  entries.
+
+Handlers change the loaded :class:`Session` and call :func:`save`; nothing
+is written back implicitly.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from services import storage
+from services.cache import TTLCache
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+
+
+def session_key(uid: int) -> str:
+    return f"session:{uid}"
+
+
+@dataclass(slots=True)
+class Session:
+    mode: str
+    step: int = 0
+    score: int = 0
+    # expected answer text for the current question
+    answer: str = ""
+    # test category or admin search kind
+    topic: str = ""
+    # user ids offered to an admin to pick from
+    choices: list[int] = field(default_factory=list)
+    # question indexes dealt for this game, asked in order
+    deck: list[int] = field(default_factory=list)
+
+    def dump(self) -> str:
+        return json.dumps(
+            [self.mode, self.step, self.score, self.answer, self.topic, self.choices, self.deck],
+            ensure_ascii=False, separators=(",", ":"),
+        )
+
+    @classmethod
+    def load(cls, raw: str) -> "Session":
+        return cls(*json.loads(raw))
+
+
+class MemorySessionStore:
+    """Serialized sessions in a process-local LRU with expiry."""
+
+    def __init__(self, max_size: int = SESSION_MAX, ttl: int = SESSION_TTL) -> None:
+        self._items = TTLCache(max_size, ttl)
+
+    async def get(self, uid: int) -> Optional[Session]:
+        raw = self._items.get(uid)
+        return Session.load(raw) if raw else None
+
+    async def save(self, uid: int, session: Session) -> None:
+        self._items.set(uid, session.dump())
+
+    async def drop(self, uid: int) -> None:
+        self._items.pop(uid)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class RedisSessionStore:
+    def __init__(self, ttl: int = SESSION_TTL) -> None:
+        self.ttl = ttl
+
+    async def get(self, uid: int) -> Optional[Session]:
+        raw = await storage.redis.get(session_key(uid))
+        return Session.load(raw) if raw else None
+
+    async def save(self, uid: int, session: Session) -> None:
+        await storage.redis.set(session_key(uid), session.dump(), ex=self.ttl)
+
+    async def drop(self, uid: int) -> None:
+        await storage.redis.delete(session_key(uid))
+
+
+store: MemorySessionStore | RedisSessionStore = MemorySessionStore()
+
+
+def configure() -> None:
+    """Pick the backend matching the connection made by storage.connect()."""
+    global store
+    if isinstance(storage.redis, storage.MemoryRedis):
+        store = MemorySessionStore()
+    else:
+        store = RedisSessionStore()
+
+
+async def get(uid: int) -> Optional[Session]:
+    return await store.get(uid)
+
+
+async def start(uid: int, mode: str, **fields) -> Session:
+    """Replace whatever the user was doing with a fresh session."""
+    session = Session(mode, **fields)
+    await store.save(uid, session)
+    return session
+
+
+async def save(uid: int, session: Session) -> None:
+    await store.save(uid, session)
+
+
+async def drop(uid: int) -> None:
+    await store.drop(uid)
@@ -0,0 +1,311 @@
+"""Per-user stats stored in Redis hashes.
+
+Layout (``period`` is the all-time key or the key for today):
+
+* ``user:{uid}:stats`` / ``user:{uid}:stats:daily:{day}`` — hash with
+  ``tests``, ``points``, ``best_truth``, ``best_assoc``, ``best_blitz``, ``last``
+* ``<stats key>:brands`` — hash ``brand -> category`` of viewed brands
+* ``history:daily:{day}`` / ``history:total`` — event counters
+* ``history:weekly:{week}`` / ``history:monthly:{month}`` — the daily
+  counters rolled up by :mod:`services.retention`
+* ``leaderboard:{board}`` — sorted sets behind the admin top lists
+
+Daily keys expire ``STATS_DAILY_TTL_DAYS`` days after their last write.
+
+Nothing here is written by the handlers directly: activity goes to the
+event log (:mod:`services.event_log`), and events are merged into per-user
+:class:`Delta` records and written as one MULTI/EXEC pipeline per batch,
+so concurrent answers can't overwrite each other.
+
+Older deployments kept JSON blobs under the same keys. Every read and
+write of a user's stats first runs :data:`migrate_key`, which converts a
+blob it finds into the hashes in place, so existing users keep working
+after a deploy. ``python -m services.stats migrate`` converts all of them
+at once and ``python -m services.stats backfill`` builds the leaderboards.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+from services import leaderboards, storage
+
+TZ = ZoneInfo("Asia/Almaty")
+# Long enough for the retention job to roll a day up into its month
+DAILY_TTL = int(os.getenv("STATS_DAILY_TTL_DAYS", "35")) * 86400
+
+DEFAULT_STATS = {
+    "tests": 0,
+    "brands": {},
+    "points": 0,
+    "last": "",
+    "best_truth": 0,
+    "best_assoc": 0,
+    "best_blitz": 0,
+}
+
+COUNTERS = ("tests", "points", "best_truth", "best_assoc", "best_blitz")
+
+# HMAX key field value: keep the larger of the stored and the new value.
+HMAX_LUA = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local value = tonumber(ARGV[2])
+if value > current then
+    redis.call('HSET', KEYS[1], ARGV[1], value)
+    return value
+end
+return current
+"""
+
+
+def _hmax(store, keys, args) -> int:
+    current = int(store.hashes.get(keys[0], {}).get(args[0], 0))
+    value = int(args[1])
+    if value > current:
+        store.hashes.setdefault(keys[0], {})[args[0]] = str(value)
+        return value
+    return current
+
+
+hmax = storage.Script(HMAX_LUA, _hmax)
+
+# Convert a legacy JSON blob at KEYS[1] into the counters hash KEYS[1] and
+# the brands hash KEYS[2]; return 1 if there was one. Atomic, so a write
+# can't land between reading the blob and replacing it.
+MIGRATE_LUA = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'string' then
+    return 0
+end
+local st = cjson.decode(redis.call('GET', KEYS[1]))
+redis.call('DEL', KEYS[1])
+for field, value in pairs(st) do
+    if field == 'brands' then
+        if type(value) == 'table' then
+            for brand, category in pairs(value) do
+                redis.call('HSET', KEYS[2], brand, category)
+            end
+        end
+    elseif field == 'tests' or field == 'points' or field == 'last' or string.sub(field, 1, 5) == 'best_' then
+        redis.call('HSET', KEYS[1], field, tostring(value))
+    end
+end
+return 1
+"""
+
+
+def _migrate(store, keys, args) -> int:
+    raw = store.data.pop(keys[0], None)
+    if raw is None:
+        return 0
+    store.expires.pop(keys[0], None)
+    st = json.loads(raw)
+    brands = st.pop("brands", None)
+    if isinstance(brands, dict):
+        store.hashes.setdefault(keys[1], {}).update(brands)
+    counters = {
+        field: str(value) for field, value in st.items()
+        if field in ("tests", "points", "last") or field.startswith("best_")
+    }
+    if counters:
+        store.hashes.setdefault(keys[0], {}).update(counters)
+    return 1
+
+
+migrate_key = storage.Script(MIGRATE_LUA, _migrate)
+
+
+def today() -> str:
+    return datetime.now(TZ).strftime("%Y-%m-%d")
+
+
+def now_str() -> str:
+    return datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def stats_key(uid: int, period: str = "total", day: Optional[str] = None) -> str:
+    if period == "daily":
+        return f"user:{uid}:stats:daily:{day or today()}"
+    return f"user:{uid}:stats"
+
+
+def brands_key(uid: int, period: str = "total", day: Optional[str] = None) -> str:
+    return stats_key(uid, period, day) + ":brands"
+
+
+def _period_keys(uid: int, day: str) -> tuple[str, str]:
+    return stats_key(uid), stats_key(uid, "daily", day)
+
+
+def history_key(period: str, label: str = "") -> str:
+    return f"history:{period}:{label}" if label else f"history:{period}"
+
+
+async def queue_migrate(pipe, key: str) -> None:
+    """Queue the conversion of ``key`` in case it is still a legacy blob."""
+    await migrate_key([key, key + ":brands"], [], client=pipe)
+
+
+async def get_stats(uid: int, period: str = "total") -> dict:
+    key = stats_key(uid, period)
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        await queue_migrate(pipe, key)
+        pipe.hgetall(key)
+        pipe.hgetall(key + ":brands")
+        _, counters, brands = await pipe.execute()
+    st = {**DEFAULT_STATS, "brands": dict(brands)}
+    for field in COUNTERS:
+        st[field] = int(counters.get(field, 0))
+    st["last"] = counters.get("last", "")
+    return st
+
+
+@dataclass(slots=True)
+class Delta:
+    """Stats changes of one user on one day, merged before they are written."""
+
+    # brand -> category, in viewing order
+    brands: dict[str, str] = field(default_factory=dict)
+    tests: int = 0
+    points: int = 0
+    # game -> best points in this delta
+    best: dict[str, int] = field(default_factory=dict)
+    # history event -> count
+    events: Counter[str] = field(default_factory=Counter)
+    last: str = ""
+
+    def add_brand(self, brand: str, category: str, at: str) -> None:
+        self.brands.setdefault(brand, category)
+        self.events["brands"] += 1
+        self.last = max(self.last, at)
+
+    def add_test(self, points: int, at: str) -> None:
+        self.tests += 1
+        self.points += points
+        self.events["tests"] += 1
+        self.last = max(self.last, at)
+
+    def add_game(self, game: str, points: int, at: str) -> None:
+        self.points += points
+        self.best[game] = max(points, self.best.get(game, 0))
+        self.events[game] += 1
+        self.last = max(self.last, at)
+
+
+async def queue_delta(pipe, uid: int, day: str, delta: Delta) -> None:
+    total, daily = _period_keys(uid, day)
+    for key in (total, daily):
+        await queue_migrate(pipe, key)
+    for brand, category in delta.brands.items():
+        await leaderboards.add_brand(pipe, total + ":brands", uid, brand, category)
+        pipe.hsetnx(daily + ":brands", brand, category)
+    if delta.brands:
+        pipe.expire(daily + ":brands", DAILY_TTL)
+    for key in (total, daily):
+        if delta.tests:
+            pipe.hincrby(key, "tests", delta.tests)
+        if delta.points:
+            pipe.hincrby(key, "points", delta.points)
+        for game, points in delta.best.items():
+            await hmax([key], [f"best_{game}", points], client=pipe)
+        if delta.last:
+            pipe.hset(key, "last", delta.last)
+    if delta.last:
+        pipe.expire(daily, DAILY_TTL)
+    leaderboards.add_points(pipe, uid, delta.tests, delta.points, delta.best.get("blitz"))
+    history = history_key("daily", day)
+    for event, count in delta.events.items():
+        pipe.hincrby(history, event, count)
+        pipe.hincrby(history_key("total"), event, count)
+    pipe.expire(history, DAILY_TTL)
+
+
+async def write(deltas: Iterable[tuple[int, str, Delta]]) -> None:
+    """Apply ``(uid, day, delta)`` records in one MULTI/EXEC pipeline."""
+    async with storage.redis.pipeline(transaction=True) as pipe:
+        for uid, day, delta in deltas:
+            await queue_delta(pipe, uid, day, delta)
+        await pipe.execute()
+
+
+async def best_score(uid: int, game: str) -> int:
+    key = stats_key(uid)
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        await queue_migrate(pipe, key)
+        pipe.hget(key, f"best_{game}")
+        _, best = await pipe.execute()
+    return int(best or 0)
+
+
+async def migrate_legacy() -> int:
+    """Convert all JSON stats blobs written by older versions into hashes."""
+    r = storage.redis
+    migrated = 0
+    async for key in r.scan_iter("user:*:stats*"):
+        if not key.endswith(":brands") and await r.type(key) == "string":
+            migrated += await migrate_key([key, key + ":brands"], [])
+    return migrated
+
+
+async def backfill_leaderboards(batch: int = 500) -> int:
+    """Rebuild every leaderboard from the all-time stats hashes."""
+    r = storage.redis
+    await migrate_legacy()
+    uids: list[int] = []
+    total = 0
+
+    async def flush() -> None:
+        async with r.pipeline(transaction=False) as pipe:
+            for uid in uids:
+                pipe.hgetall(stats_key(uid))
+                pipe.hlen(brands_key(uid))
+            rows = await pipe.execute()
+        async with r.pipeline(transaction=False) as pipe:
+            for uid, counters, brands in zip(uids, rows[::2], rows[1::2]):
+                scores = {
+                    "best_blitz": counters.get("best_blitz", 0),
+                    "tests": counters.get("tests", 0),
+                    "points": counters.get("points", 0),
+                    "brands": brands,
+                }
+                for board, score in scores.items():
+                    pipe.zadd(leaderboards.board_key(board), {uid: int(score)})
+            await pipe.execute()
+
+    async for key in r.scan_iter("user:*:stats"):
+        uids.append(int(key.split(":")[1]))
+        if len(uids) >= batch:
+            await flush()
+            total += len(uids)
+            uids.clear()
+    if uids:
+        await flush()
+        total += len(uids)
+    return total
+
+
+async def _cli(command: str) -> None:
+    await storage.connect(os.getenv("REDIS_URL", storage.DEFAULT_URL))
+    try:
+        if command == "migrate":
+            print(f"Migrated {await migrate_legacy()} stats keys")
+        elif command == "backfill":
+            print(f"Leaderboards rebuilt for {await backfill_leaderboards()} users")
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    load_dotenv()
+    asyncio.run(_cli(sys.argv[1] if len(sys.argv) > 1 else "migrate"))
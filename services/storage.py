@@ -0,0 +1,374 @@
+"""Shared async Redis client with an in-memory fallback."""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from fnmatch import fnmatchcase
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from services import metrics
+
+DEFAULT_URL = "redis://localhost:6379/0"
+
+# ConnectionPool raises instead of waiting once it is used up, so it must be
+# larger than what can run at once: one connection per update the webhook
+# handles (WEBHOOK_MAX_IN_FLIGHT) plus the background workers (aggregator,
+# retention, stats buffer, media warm-up) with room to spare.
+BACKGROUND_CONNECTIONS = 16
+MAX_CONNECTIONS = int(os.getenv(
+    "REDIS_MAX_CONNECTIONS", str(int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "64")) + BACKGROUND_CONNECTIONS),
+))
+
+
+# Python twins of Lua scripts, keyed by script source, so MemoryRedis can run them.
+_memory_scripts: dict[str, Callable[["MemoryRedis", Sequence[str], Sequence[Any]], Any]] = {}
+
+
+class Script:
+    """Lua script registered on whichever client ``connect`` picked.
+
+    ``memory_impl`` mirrors the script for MemoryRedis; it receives the store,
+    the keys and the args and works on the raw dicts.
+    """
+
+    def __init__(self, lua: str, memory_impl: Callable) -> None:
+        self.lua = lua
+        self._client: Any = None
+        self._script: Any = None
+        _memory_scripts[lua] = memory_impl
+
+    async def __call__(self, keys: Sequence[str], args: Sequence[Any], client: Any = None) -> Any:
+        if self._client is not redis:
+            self._client = redis
+            self._script = redis.register_script(self.lua)
+        return await self._script(keys=keys, args=args, client=client)
+
+
+class MemoryPipeline:
+    """Queues MemoryRedis calls and runs them back to back on ``execute``.
+
+    Between ``watch`` and ``multi`` calls run at once, as on a Redis
+    pipeline; nothing else can run in between, so a watch never fails.
+    """
+
+    def __init__(self, store: "MemoryRedis") -> None:
+        self.store = store
+        self.calls: list[tuple[Callable, tuple, dict]] = []
+        self.watching = False
+
+    async def watch(self, *keys: str) -> None:
+        self.watching = True
+
+    def multi(self) -> None:
+        self.watching = False
+
+    def __getattr__(self, name: str):
+        method = getattr(self.store, name)
+        if self.watching:
+            return method
+
+        def queue(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def __await__(self):
+        async def _self():
+            return self
+        return _self().__await__()
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        calls, self.calls = self.calls, []
+        results = []
+        for method, args, kwargs in calls:
+            try:
+                results.append(await method(*args, **kwargs))
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+    async def __aenter__(self) -> "MemoryPipeline":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.calls = []
+        self.watching = False
+
+
+class MemoryScript:
+    def __init__(self, store: "MemoryRedis", impl: Callable) -> None:
+        self.store = store
+        self.impl = impl
+
+    async def run(self, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        return self.impl(self.store, keys, args)
+
+    async def __call__(self, keys: Sequence[str] = (), args: Sequence[Any] = (), client: Any = None) -> Any:
+        if isinstance(client, MemoryPipeline):
+            client.calls.append((self.run, (keys, args), {}))
+            return client
+        return await self.run(keys, args)
+
+
+class MemoryRedis:
+    """Minimal in-memory replacement for Redis used in tests."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+        self.hashes: dict[str, dict[str, str]] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+        self.sets: dict[str, set[str]] = {}
+        # key -> monotonic deadline; expired keys are dropped on the next scan
+        self.expires: dict[str, float] = {}
+
+    async def ping(self) -> bool:
+        return True
+
+    def pipeline(self, transaction: bool = True) -> MemoryPipeline:
+        return MemoryPipeline(self)
+
+    def register_script(self, lua: str) -> MemoryScript:
+        return MemoryScript(self, _memory_scripts[lua])
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.data.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self.data[key] = value
+
+    async def delete(self, *keys: str) -> int:
+        removed = 0
+        for k in keys:
+            self.expires.pop(k, None)
+            for store in (self.data, self.hashes, self.zsets, self.sets):
+                removed += store.pop(k, None) is not None
+        return removed
+
+    async def type(self, key: str) -> str:
+        if key in self.data:
+            return "string"
+        if key in self.hashes:
+            return "hash"
+        if key in self.zsets:
+            return "zset"
+        if key in self.sets:
+            return "set"
+        return "none"
+
+    async def hget(self, name: str, key: str) -> Optional[str]:
+        return self.hashes.get(name, {}).get(key)
+
+    async def hmget(self, name: str, keys: Sequence[str]) -> list[Optional[str]]:
+        h = self.hashes.get(name, {})
+        return [h.get(k) for k in keys]
+
+    async def hset(self, name: str, key: Optional[str] = None, value: Any = None,
+                   mapping: Optional[dict] = None) -> int:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        h = self.hashes.setdefault(name, {})
+        added = sum(1 for k in items if k not in h)
+        h.update({k: str(v) for k, v in items.items()})
+        return added
+
+    async def hsetnx(self, name: str, key: str, value: Any) -> int:
+        h = self.hashes.setdefault(name, {})
+        if key in h:
+            return 0
+        h[key] = str(value)
+        return 1
+
+    async def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        h = self.hashes.setdefault(name, {})
+        value = int(h.get(key, 0)) + amount
+        h[key] = str(value)
+        return value
+
+    async def hdel(self, name: str, *keys: str) -> int:
+        h = self.hashes.get(name, {})
+        return sum(h.pop(k, None) is not None for k in keys)
+
+    async def hlen(self, name: str) -> int:
+        return len(self.hashes.get(name, {}))
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        return self.hashes.get(name, {}).copy()
+
+    async def sadd(self, name: str, *values: Any) -> int:
+        s = self.sets.setdefault(name, set())
+        before = len(s)
+        s.update(str(v) for v in values)
+        return len(s) - before
+
+    async def srem(self, name: str, *values: Any) -> int:
+        s = self.sets.get(name, set())
+        before = len(s)
+        s.difference_update(str(v) for v in values)
+        if not s:
+            self.sets.pop(name, None)
+        return before - len(s)
+
+    async def smembers(self, name: str) -> set[str]:
+        return set(self.sets.get(name, set()))
+
+    async def sinter(self, *names: str) -> set[str]:
+        sets = [self.sets.get(n, set()) for n in names]
+        return set.intersection(*sets) if sets else set()
+
+    async def sunion(self, *names: str) -> set[str]:
+        return set().union(*(self.sets.get(n, set()) for n in names))
+
+    async def zadd(self, name: str, mapping: dict, gt: bool = False) -> int:
+        z = self.zsets.setdefault(name, {})
+        added = 0
+        for member, score in mapping.items():
+            member = str(member)
+            if member not in z:
+                added += 1
+            elif gt and score <= z[member]:
+                continue
+            z[member] = float(score)
+        return added
+
+    async def zincrby(self, name: str, amount: float, value: Any) -> float:
+        z = self.zsets.setdefault(name, {})
+        member = str(value)
+        z[member] = z.get(member, 0.0) + amount
+        return z[member]
+
+    async def zscore(self, name: str, value: Any) -> Optional[float]:
+        return self.zsets.get(name, {}).get(str(value))
+
+    async def zcard(self, name: str) -> int:
+        return len(self.zsets.get(name, {}))
+
+    async def zrevrange(self, name: str, start: int, end: int, withscores: bool = False) -> list:
+        rows = sorted(self.zsets.get(name, {}).items(), key=lambda x: (x[1], x[0]), reverse=True)
+        rows = rows[start:] if end == -1 else rows[start:end + 1]
+        return rows if withscores else [member for member, _ in rows]
+
+    async def zrangebylex(
+        self, name: str, min: str, max: str, start: Optional[int] = None, num: Optional[int] = None,
+    ) -> list[str]:
+        def inside(member: bytes, bound: str, low: bool) -> bool:
+            if bound in ("-", "+"):
+                return (bound == "-") == low
+            edge = bound[1:].encode()
+            if bound[0] == "[":
+                return member >= edge if low else member <= edge
+            return member > edge if low else member < edge
+
+        # Redis orders members of equal score by their bytes
+        members = sorted(self.zsets.get(name, {}), key=str.encode)
+        rows = [m for m in members if inside(m.encode(), min, True) and inside(m.encode(), max, False)]
+        if start is not None:
+            rows = rows[start:start + num] if num is not None and num >= 0 else rows[start:]
+        return rows
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        if not await self.exists(key):
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    async def ttl(self, key: str) -> int:
+        if not await self.exists(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else max(0, int(deadline - time.monotonic()))
+
+    async def memory_usage(self, key: str) -> Optional[int]:
+        """Rough size of the key's payload in bytes."""
+        for store in (self.data, self.hashes, self.zsets, self.sets):
+            if key in store:
+                return len(key) + len(repr(store[key]))
+        return None
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, deadline in self.expires.items() if deadline <= now]:
+            del self.expires[key]
+            for store in (self.data, self.hashes, self.zsets, self.sets):
+                store.pop(key, None)
+
+    def _all_keys(self) -> list[str]:
+        self._purge_expired()
+        return list(self.data) + list(self.hashes) + list(self.zsets) + list(self.sets)
+
+    async def keys(self, pattern: str = "*") -> list[str]:
+        return [k for k in self._all_keys() if fnmatchcase(k, pattern)]
+
+    async def scan_iter(self, match: str = "*", count: Optional[int] = None) -> AsyncIterator[str]:
+        for k in self._all_keys():
+            if fnmatchcase(k, match):
+                yield k
+
+    async def exists(self, *keys: str) -> int:
+        stores = (self.data, self.hashes, self.zsets, self.sets)
+        return sum(1 for k in keys if any(k in store for store in stores))
+
+    async def aclose(self) -> None:
+        pass
+
+
+# Replaced by connect() on startup; until then everything goes to memory.
+redis: Redis | MemoryRedis = MemoryRedis()
+
+
+COMMAND_SECONDS = metrics.Histogram(
+    "bot_redis_command_seconds", "Redis round trips by command; pipelines count as one",
+    ("command",), metrics.FAST_BUCKETS,
+)
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list:
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, "pipeline")
+
+
+class TimedRedis(Redis):
+    """Redis client that records how long every command takes."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, str(args[0]).lower())
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+async def connect(url: str) -> None:
+    """Open the shared connection pool, falling back to memory if Redis is down."""
+    global redis
+    pool = ConnectionPool.from_url(url, decode_responses=True, max_connections=MAX_CONNECTIONS)
+    client = TimedRedis.from_pool(pool)
+    try:
+        await client.ping()
+    except Exception as e:  # Redis unavailable
+        logging.warning("Redis unavailable, using in-memory store: %s", e)
+        await client.aclose()
+        redis = MemoryRedis()
+    else:
+        redis = client
+
+
+async def close() -> None:
+    await redis.aclose()
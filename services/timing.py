@@ -0,0 +1,189 @@
+"""Where update time goes: filters versus handlers.
+
+:class:`UpdateTimingMiddleware` (outer, on ``dp.update``) starts an
+:class:`UpdateTiming` for every update and :class:`HandlerTimingMiddleware`
+(inner, on the message and callback observers) times the handler that
+took it. :func:`instrument_filters` wraps every registered filter, so each
+call is added to the current update and to the per-filter totals
+``bot_filter_calls_total`` / ``bot_filter_seconds_total``. Filters are
+labelled by handler and position, with lambdas shown as ``lambda@file:line``.
+
+Updates slower than ``SLOW_UPDATE_MS`` go into a ring buffer of the last
+``SLOW_LOG_SIZE``; :func:`report` and :func:`snapshot` list the slowest of
+them together with the most expensive filters. Only the update type,
+handler and timings are kept: no user ids or message text.
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Deque, Optional
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.handler import FilterObject
+from aiogram.filters.base import Filter
+from aiogram.types import TelegramObject, Update
+
+from services import metrics, stats
+from services.instrumentation import handler_name
+
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", "250"))
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", "100"))
+
+FILTER_CALLS = metrics.Counter("bot_filter_calls_total", "Filter calls", ("router", "filter"))
+FILTER_SECONDS = metrics.Counter("bot_filter_seconds_total", "Time spent in filters", ("router", "filter"))
+UPDATE_FILTER_SECONDS = metrics.Histogram(
+    "bot_update_filter_seconds", "Filter time per update", ("type",), metrics.FAST_BUCKETS,
+)
+
+
+@dataclass(slots=True)
+class UpdateTiming:
+    update_id: int
+    type: str
+    at: str
+    started: float
+    total: float = 0.0
+    filters: float = 0.0
+    filter_calls: int = 0
+    slowest_filter: str = ""
+    slowest_filter_time: float = 0.0
+    handler: str = ""
+    handler_time: float = 0.0
+
+    def add_filter(self, label: str, spent: float) -> None:
+        self.filters += spent
+        self.filter_calls += 1
+        if spent > self.slowest_filter_time:
+            self.slowest_filter, self.slowest_filter_time = label, spent
+
+
+current: ContextVar[Optional[UpdateTiming]] = ContextVar("update_timing", default=None)
+slow_log: Deque[UpdateTiming] = deque(maxlen=SLOW_LOG_SIZE)
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        timing = UpdateTiming(event.update_id, event.event_type, stats.now_str(), time.perf_counter())
+        token = current.set(timing)
+        try:
+            return await handler(event, data)
+        finally:
+            current.reset(token)
+            timing.total = time.perf_counter() - timing.started
+            UPDATE_FILTER_SECONDS.observe(timing.filters, timing.type)
+            if timing.total * 1000 >= SLOW_UPDATE_MS:
+                slow_log.append(timing)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        timing = current.get()
+        if timing is None:
+            return await handler(event, data)
+        timing.handler = f"{data['event_router'].name}:{handler_name(data['handler'].callback)}"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            timing.handler_time = time.perf_counter() - started
+
+
+def describe(event_filter: FilterObject) -> str:
+    callback = event_filter.callback
+    if event_filter.magic is not None:
+        return "F"
+    if isinstance(callback, Filter):
+        return type(callback).__name__
+    name = getattr(callback, "__name__", type(callback).__name__)
+    if name == "<lambda>":
+        code = callback.__code__
+        return f"lambda@{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+    return name
+
+
+def _timed(event_filter: FilterObject, router: str, label: str) -> None:
+    call = event_filter.call
+
+    async def timed_call(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            spent = time.perf_counter() - started
+            FILTER_CALLS.inc(router, label)
+            FILTER_SECONDS.inc(router, label, amount=spent)
+            timing = current.get()
+            if timing is not None:
+                timing.add_filter(f"{router}/{label}", spent)
+
+    event_filter.call = timed_call
+
+
+def instrument_filters(root: Router) -> int:
+    """Time every filter registered on ``root`` and its sub-routers; return how many."""
+    wrapped = 0
+    for router in root.chain_tail:
+        for observer in router.observers.values():
+            groups = [("*", observer._handler.filters)]
+            groups += [(handler_name(h.callback), h.filters) for h in observer.handlers]
+            for owner, filters in groups:
+                for i, event_filter in enumerate(filters or ()):
+                    _timed(event_filter, router.name, f"{owner}[{i}] {describe(event_filter)}")
+                    wrapped += 1
+    return wrapped
+
+
+def slowest(limit: int = 10) -> list[UpdateTiming]:
+    return sorted(slow_log, key=lambda t: t.total, reverse=True)[:limit]
+
+
+def costly_filters(limit: int = 10) -> list[tuple[str, str, int, float]]:
+    """(router, filter, calls, seconds), most total time first."""
+    rows = [(*labels, int(FILTER_CALLS.values[labels]), spent) for labels, spent in FILTER_SECONDS.values.items()]
+    return sorted(rows, key=lambda row: row[3], reverse=True)[:limit]
+
+
+def snapshot(limit: int = 20) -> dict:
+    return {
+        "threshold_ms": SLOW_UPDATE_MS,
+        "slow_updates": [{k: v for k, v in asdict(t).items() if k != "started"} for t in slowest(limit)],
+        "filters": [
+            {"router": router, "filter": label, "calls": calls, "seconds": spent}
+            for router, label, calls, spent in costly_filters(limit)
+        ],
+    }
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} мс"
+
+
+def report(limit: int = 10) -> str:
+    """Admin panel text: the slowest updates and the most expensive filters."""
+    lines = [f"🐢 Апдейты дольше {SLOW_UPDATE_MS:.0f} мс:"]
+    for i, t in enumerate(slowest(limit), 1):
+        lines.append(
+            f"{i}. {_ms(t.total)} — {t.handler or 'без хендлера'} ({t.type}) {t.at}\n"
+            f"   фильтры {_ms(t.filters)} ({t.filter_calls}), хендлер {_ms(t.handler_time)}"
+            + (f", дольше всех {t.slowest_filter}" if t.slowest_filter else "")
+        )
+    if len(lines) == 1:
+        lines.append("нет")
+    lines.append("\n⏱ Фильтры по суммарному времени:")
+    for i, (router, label, calls, spent) in enumerate(costly_filters(limit), 1):
+        lines.append(f"{i}. {router}/{label} — {_ms(spent)} за {calls}")
+    return "\n".join(lines)
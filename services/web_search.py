@@ -0,0 +1,289 @@
+"""Bing web search for the AI-live mode, pooled and cached.
+
+One ``aiohttp.ClientSession`` with a bounded connector is opened at startup
+and reused for every query, so connections, TLS sessions and DNS answers
+are kept between requests.
+
+Results are cached by normalized query: in-process (LRU + TTL) and, when a
+real Redis is connected, under ``search:{key}`` so all replicas share hits.
+Queries that found nothing are cached too, for ``SEARCH_NEGATIVE_TTL``
+seconds. Errors are not cached.
+
+Concurrent lookups of the same normalized query share one upstream call
+(single flight); ``counters["coalesced"]`` counts the requests that
+waited on another one instead of calling out.
+
+Every lookup has a ``SEARCH_BUDGET`` second deadline shared by all its
+attempts. With ``SEARCH_HEDGE_AFTER`` set, a second request is sent if the
+first hasn't answered (or has failed) by then, and the first good answer
+wins. After ``SEARCH_BREAKER_THRESHOLD`` failures in a row the circuit
+breaker opens and lookups return nothing at once, so callers fall back
+to local answers; after ``SEARCH_BREAKER_COOLDOWN`` seconds one probe
+request is let through. :func:`metrics` reports the breaker state,
+counters and upstream latency percentiles.
+
+``BING_ENDPOINT`` can point at a local fake server for testing.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+import aiohttp
+
+from services import storage
+from services.cache import TTLCache
+from services.metrics import Histogram, StateGauge
+
+ENDPOINT = os.getenv("BING_ENDPOINT", "https://api.bing.microsoft.com/v7.0/search")
+MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+BUDGET = float(os.getenv("SEARCH_BUDGET", "4"))
+# 0 disables hedging
+HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", "0"))
+BREAKER_THRESHOLD = int(os.getenv("SEARCH_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("SEARCH_BREAKER_COOLDOWN", "30"))
+CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+NEGATIVE_TTL = int(os.getenv("SEARCH_NEGATIVE_TTL", "600"))
+# Only these fields of a result are used, so only these are cached
+RESULT_FIELDS = ("name", "snippet", "url")
+
+_session: Optional[aiohttp.ClientSession] = None
+_redis_tier = False
+cache = TTLCache(CACHE_SIZE, CACHE_TTL)
+counters: Counter[str] = Counter()
+# cache key -> upstream lookup in progress
+_flights: Dict[str, asyncio.Task] = {}
+UPSTREAM_SECONDS = Histogram("bot_web_search_seconds", "Bing API calls", ("outcome",))
+# seconds per upstream call, most recent last
+latencies: Deque[float] = deque(maxlen=1024)
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures.
+
+    While open nothing is let through until ``cooldown`` has passed; then a
+    single probe is allowed, and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    STATES = ("closed", "open", "half_open")
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self._probing and time.monotonic() - self.opened_at >= self.cooldown:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release(self) -> None:
+        """End a probe that got no answer (cancelled), so the next request probes again."""
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logging.warning("Web search circuit opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+BREAKER_STATE = StateGauge(
+    "bot_web_search_breaker_state", "Web search circuit breaker", CircuitBreaker.STATES, lambda: breaker.state,
+)
+
+
+def cache_key(key: str, mkt: str, count: int) -> str:
+    return f"search:{mkt}:{count}:{key}"
+
+
+async def start() -> None:
+    global _session, _redis_tier
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+    _redis_tier = (
+        os.getenv("SEARCH_CACHE_REDIS", "1") != "0"
+        and not isinstance(storage.redis, storage.MemoryRedis)
+    )
+
+
+async def close() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def _cached(key: str) -> Optional[List[Dict]]:
+    results = cache.get(key)
+    if results is not None:
+        counters["cache_hits"] += 1
+        return results
+    if _redis_tier:
+        raw = await storage.redis.get(key)
+        if raw is not None:
+            counters["redis_hits"] += 1
+            results = json.loads(raw)
+            cache.set(key, results, CACHE_TTL if results else NEGATIVE_TTL)
+            return results
+    return None
+
+
+async def _store(key: str, results: List[Dict]) -> None:
+    ttl = CACHE_TTL if results else NEGATIVE_TTL
+    cache.set(key, results, ttl)
+    if _redis_tier:
+        await storage.redis.set(key, json.dumps(results, ensure_ascii=False), ex=ttl)
+
+
+def _parse(data: object) -> List[Dict]:
+    """The results in a response body; ValueError if it isn't shaped like one."""
+    if not isinstance(data, dict):
+        raise ValueError(f"unexpected response body: {type(data).__name__}")
+    pages = data.get("webPages", {})
+    items = pages.get("value", []) if isinstance(pages, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("unexpected webPages in the response")
+    return [{f: item[f] for f in RESULT_FIELDS if f in item} for item in items]
+
+
+async def fetch(query: str, api_key: str, *, mkt: str, count: int, timeout: float) -> Optional[List[Dict]]:
+    """Query the endpoint; None means the call failed and shouldn't be cached."""
+    if _session is None:
+        await start()
+    headers = {"Ocp-Apim-Subscription-Key": api_key}
+    params = {"q": query, "mkt": mkt, "count": count, "textDecorations": "false", "textFormat": "Raw"}
+    counters["requests"] += 1
+    started = time.monotonic()
+    answered = False
+    try:
+        try:
+            async with _session.get(
+                ENDPOINT, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as r:
+                if r.status != 200:
+                    raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+                results = _parse(await r.json())
+        except (aiohttp.ClientError, TimeoutError, ValueError) as e:
+            latencies.append(time.monotonic() - started)
+            UPSTREAM_SECONDS.observe(latencies[-1], "error")
+            counters["errors"] += 1
+            breaker.failure()
+            answered = True
+            logging.warning("Web search failed: %r", e)
+            return None
+        latencies.append(time.monotonic() - started)
+        UPSTREAM_SECONDS.observe(latencies[-1], "ok")
+        breaker.success()
+        answered = True
+        return results
+    finally:
+        if not answered:
+            # cancelled (a hedge lost, the lookup was dropped) or an unexpected
+            # error: a half-open probe must not stay claimed
+            breaker.release()
+
+
+async def search(query: str, key: str, *, mkt: str = "ru-RU", count: int = 5) -> List[Dict]:
+    """Return web results for ``query``; ``key`` is its normalized form."""
+    api_key = os.getenv("BING_API_KEY")
+    if not api_key:
+        return []
+    ck = cache_key(key, mkt, count)
+    results = await _cached(ck)
+    if results is not None:
+        return results
+    flight = _flights.get(ck)
+    if flight is None:
+        if not breaker.allow():
+            counters["short_circuited"] += 1
+            return []
+        counters["cache_misses"] += 1
+        flight = _flights[ck] = asyncio.create_task(_lookup(ck, query, api_key, mkt, count))
+        flight.add_done_callback(lambda _: _flights.pop(ck, None))
+    else:
+        counters["coalesced"] += 1
+    # shield: a cancelled caller must not cancel the lookup others wait for
+    return await asyncio.shield(flight)
+
+
+async def _lookup(ck: str, query: str, api_key: str, mkt: str, count: int) -> List[Dict]:
+    results = await _hedged(query, api_key, mkt, count, time.monotonic() + BUDGET)
+    if results is None:
+        return []
+    await _store(ck, results)
+    return results
+
+
+async def _hedged(query: str, api_key: str, mkt: str, count: int, deadline: float) -> Optional[List[Dict]]:
+    """Run the call, adding one hedge attempt if the first is slow or fails."""
+    def attempt() -> asyncio.Task:
+        remaining = deadline - time.monotonic()
+        return asyncio.create_task(fetch(query, api_key, mkt=mkt, count=count, timeout=remaining))
+
+    pending = {attempt()}
+    hedged = not HEDGE_AFTER
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=None if hedged else HEDGE_AFTER, return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.result() is not None:
+                    return task.result()
+            if not hedged and deadline - time.monotonic() > 0 and breaker.allow():
+                hedged = True
+                counters["hedged"] += 1
+                pending.add(attempt())
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def latency_percentiles() -> Dict[str, float]:
+    ordered = sorted(latencies)
+    if not ordered:
+        return {}
+    return {
+        f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+        for p in (50, 90, 99)
+    }
+
+
+def metrics() -> Dict:
+    return {
+        "breaker": breaker.state,
+        "counters": dict(counters),
+        "latency": latency_percentiles(),
+        "cache_size": len(cache),
+        "in_flight": len(_flights),
+    }
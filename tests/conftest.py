@@ -0,0 +1,20 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from services import storage
+
+
+def fake_redis() -> fakeredis.FakeAsyncRedis:
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh loop; ``storage.redis`` is restored afterwards."""
+    saved = storage.redis
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+    storage.redis = saved
@@ -0,0 +1,117 @@
+import pytest
+
+from services import aggregator, event_log, leaderboards, stats, storage
+from services.event_log import DEAD_KEY, GROUP, STREAM_KEY, Event
+from tests.conftest import fake_redis
+
+
+@pytest.fixture
+def redis(run):
+    storage.redis = fake_redis()
+    return storage.redis
+
+
+def events(day: str) -> list[Event]:
+    return [
+        Event("test", 1, day, "10:00", {"points": "3"}),
+        Event("test", 1, day, "10:05", {"points": "4"}),
+        Event("brand", 2, day, "10:10", {"brand": "Jameson", "category": "whisky"}),
+    ]
+
+
+async def publish_and_read(worker: aggregator.Aggregator, day: str) -> list:
+    await worker.ensure_group()
+    await event_log.append(events(day))
+    return await worker._read(">", None)
+
+
+def test_replays_entries_read_before_a_restart(run, redis):
+    day = stats.today()
+
+    async def go():
+        # the consumer read the batch and died before applying it
+        await publish_and_read(aggregator.Aggregator("c1"), day)
+        restarted = aggregator.Aggregator("c1")
+        restarted.start()
+        await restarted.close()
+        return restarted.applied
+
+    assert run(go()) == 3
+    assert run(redis.hgetall("user:1:stats")) == {"tests": "2", "points": "7", "last": "10:05"}
+    assert run(redis.hgetall("user:2:stats:brands")) == {"Jameson": "whisky"}
+    assert run(redis.xpending(STREAM_KEY, GROUP))["pending"] == 0
+
+
+def test_failed_span_goes_to_the_dead_letter_stream(run, redis):
+    day = stats.today()
+
+    async def go():
+        # "last" can't be written to user 2's stats
+        await redis.rpush("user:2:stats", "not a hash")
+        worker = aggregator.Aggregator("c1")
+        entries = await publish_and_read(worker, day)
+        entry_ids.extend(entry_id for entry_id, _ in entries)
+        handled = await worker._apply(entries + [("0-1", None), ("0-2", {"kind": "nope"})])
+        return handled, worker.applied
+
+    entry_ids: list[str] = []
+    assert run(go()) == (5, 2)
+    assert run(redis.hgetall("user:1:stats"))["points"] == "7"
+    dead = run(redis.xrange(DEAD_KEY))
+    assert sorted((fields["id"], fields["error"].split()[0]) for _, fields in dead) == [
+        ("0-2", "malformed:"), (entry_ids[2], "WRONGTYPE"),
+    ]
+    assert run(redis.xpending(STREAM_KEY, GROUP))["pending"] == 0
+    assert run(redis.keys(aggregator.applied_key("*"))) == []
+
+
+def test_partly_applied_span_is_not_applied_again(run, redis, monkeypatch):
+    day = stats.today()
+    board = leaderboards.board_key("brands")
+    monkeypatch.setattr(aggregator, "CLAIM_IDLE_MS", 0)
+    finish = aggregator.Aggregator._finish
+    crashes = [RuntimeError("crashed before XACK")] * 2
+
+    async def flaky_finish(self, *args):
+        if crashes:
+            raise crashes.pop()
+        await finish(self, *args)
+
+    monkeypatch.setattr(aggregator.Aggregator, "_finish", flaky_finish)
+
+    async def go():
+        await redis.rpush("user:2:stats", "not a hash")
+        worker = aggregator.Aggregator("c1")
+        entries = await publish_and_read(worker, day)
+        with pytest.raises(RuntimeError):
+            await worker._apply(entries)
+        # claimed twice: the first claim crashes again, the second acknowledges
+        other = aggregator.Aggregator("c2")
+        with pytest.raises(RuntimeError):
+            await other.step(block=None)
+        assert await other.step(block=None) == 3
+
+    run(go())
+    assert run(redis.hget(stats.history_key("total"), "brands")) == "1"
+    assert run(redis.hget(stats.history_key("total"), "tests")) == "2"
+    assert run(redis.zscore(board, "2")) == 1
+    assert run(redis.zscore(leaderboards.board_key("points"), "1")) == 7
+    assert run(redis.xpending(STREAM_KEY, GROUP))["pending"] == 0
+
+
+def test_entries_delivered_too_often_go_to_the_dead_letter_stream(run, redis, monkeypatch):
+    day = stats.today()
+    monkeypatch.setattr(aggregator, "CLAIM_IDLE_MS", 0)
+    monkeypatch.setattr(aggregator, "MAX_DELIVERIES", 2)
+
+    async def go():
+        worker = aggregator.Aggregator("c1")
+        await publish_and_read(worker, day)
+        for _ in range(aggregator.MAX_DELIVERIES):
+            await redis.xautoclaim(STREAM_KEY, GROUP, "c1", 0, "0-0")
+        return await worker.step(block=None), worker.applied
+
+    assert run(go()) == (3, 0)
+    assert run(redis.xlen(DEAD_KEY)) == 3
+    assert run(redis.hgetall("user:1:stats")) == {}
+    assert run(redis.xpending(STREAM_KEY, GROUP))["pending"] == 0
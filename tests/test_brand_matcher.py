@@ -0,0 +1,44 @@
+import pytest
+
+from services.brand_matcher import BrandMatcher, normalize
+
+
+@pytest.fixture
+def matcher() -> BrandMatcher:
+    return BrandMatcher({
+        "Monkey Shoulder": ["Манки Шолдер", "monkey"],
+        "Glenfiddich 12 Years": ["Гленфиддик 12", "glenfiddich"],
+        "Glenfiddich IPA": ["Гленфиддик IPA"],
+        "Grant’s": ["Грантс", "grants"],
+    })
+
+
+def test_normalize():
+    assert normalize("Grant’s  Triple-Wood!") == "grantstriplewood"
+    assert normalize("") == "" and normalize(None) == ""
+
+
+def test_exact_by_name_or_alias(matcher):
+    assert matcher.match("Monkey Shoulder").brand == "Monkey Shoulder"
+    assert matcher.match("манки  шолдер").brand == "Monkey Shoulder"
+    assert matcher.match("GRANT'S").brand == "Grant’s"
+    assert matcher.match("  ").brand is None and matcher.match("  ").candidates == []
+
+
+def test_partial_prefix_first_then_catalog_order(matcher):
+    match = matcher.match("fiddich")
+    assert match.brand is None
+    assert match.candidates == ["Glenfiddich 12 Years", "Glenfiddich IPA"]
+    assert matcher.match("гленфиддик").candidates == ["Glenfiddich 12 Years", "Glenfiddich IPA"]
+    # prefix hits rank before hits in the middle of an alias
+    assert matcher.partial("ip") == ["Glenfiddich IPA"]
+    assert matcher.partial("gr") == ["Grant’s"]
+
+
+def test_fuzzy_only_without_substring_hits(matcher):
+    # best score first
+    assert matcher.match("glenfidich").candidates == ["Glenfiddich 12 Years", "Glenfiddich IPA"]
+    assert matcher.match("monkee").candidates == ["Monkey Shoulder"]
+    # too short for typo tolerance
+    assert matcher.match("grn").candidates == []
+    assert matcher.match("vodka").candidates == []
@@ -0,0 +1,58 @@
+import pytest
+
+from services import catalog_sync, storage
+
+from tests.conftest import fake_redis
+
+
+@pytest.fixture(autouse=True)
+def seen(monkeypatch):
+    monkeypatch.setattr(catalog_sync, "_seen", None)
+
+
+def test_publish_reaches_other_replica(run):
+    storage.redis = fake_redis()
+    reloads = []
+
+    async def reload():
+        reloads.append(1)
+
+    async def scenario():
+        assert not await catalog_sync.check(reload)
+        await catalog_sync.publish()
+        version = catalog_sync._seen
+        # the publishing replica has reloaded already
+        assert not await catalog_sync.check(reload)
+        # another replica still at the startup version
+        catalog_sync._seen = None
+        assert await catalog_sync.check(reload)
+        assert catalog_sync._seen == version
+        assert not await catalog_sync.check(reload)
+
+    run(scenario())
+    assert reloads == [1]
+
+
+def test_failed_reload_is_retried(run):
+    storage.redis = fake_redis()
+    calls = []
+
+    async def reload():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("bad brands.json")
+
+    async def scenario():
+        await storage.redis.set(catalog_sync.VERSION_KEY, "v2")
+        with pytest.raises(ValueError):
+            await catalog_sync.check(reload)
+        assert catalog_sync._seen is None
+        assert await catalog_sync.check(reload)
+
+    run(scenario())
+    assert len(calls) == 2
+
+
+def test_memory_storage_is_not_shared(run):
+    storage.redis = storage.MemoryRedis()
+    assert not catalog_sync.shared()
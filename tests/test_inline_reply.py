@@ -0,0 +1,107 @@
+import asyncio
+import json
+import re
+
+from aiogram import Bot
+from aiogram.methods import SendMessage, SendPhoto
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services import inline_reply
+from services.inline_reply import InlineReplyMiddleware, ReplySlot, build_reply
+
+
+class Upstream:
+    def __init__(self) -> None:
+        self.calls = []
+
+    async def __call__(self, bot, method):
+        self.calls.append(type(method).__name__)
+        return True
+
+
+class Body:
+    def __init__(self) -> None:
+        self.data = b""
+
+    async def write(self, chunk: bytes) -> None:
+        self.data += chunk
+
+
+async def handle(slot: ReplySlot, *calls) -> None:
+    """Run ``calls`` the way a handler would, inside the update's context."""
+    inline_reply.current_slot.set(slot)
+    for make_request, method in calls:
+        await InlineReplyMiddleware()(make_request, None, method)
+    slot.finish()
+
+
+def test_send_message_becomes_the_response(run):
+    upstream, slot = Upstream(), ReplySlot()
+    method = SendMessage(chat_id=1, text="hi")
+
+    async def scenario():
+        task = asyncio.ensure_future(handle(slot, (upstream, method)))
+        reply = await slot.wait(1)
+        await task
+        return reply
+
+    assert run(scenario()) is method
+    assert upstream.calls == []
+
+
+def test_later_call_sends_the_held_one_first(run):
+    upstream, slot = Upstream(), ReplySlot()
+    text = SendMessage(chat_id=1, text="caption follows")
+    photo = SendPhoto(chat_id=1, photo="file-id")
+
+    async def scenario():
+        await handle(slot, (upstream, text), (upstream, photo))
+        return await slot.wait(1)
+
+    # the photo is never held: its caller needs the result
+    assert run(scenario()) is None
+    assert upstream.calls == ["SendMessage", "SendPhoto"]
+
+
+def test_slow_update_sends_the_held_call_itself(run):
+    upstream, slot = Upstream(), ReplySlot()
+
+    async def slow():
+        inline_reply.current_slot.set(slot)
+        await InlineReplyMiddleware()(upstream, None, SendMessage(chat_id=1, text="early"))
+        await asyncio.sleep(0.1)
+        await InlineReplyMiddleware()(upstream, None, SendMessage(chat_id=1, text="late"))
+        slot.finish()
+
+    async def scenario():
+        task = asyncio.ensure_future(slow())
+        assert await slot.wait(0.02) is None
+        await task
+
+    run(scenario())
+    # the slot is closed: nothing is held after the deadline
+    assert upstream.calls == ["SendMessage", "SendMessage"] and slot.method is None
+
+
+def test_without_slot_calls_go_straight_out(run):
+    upstream = Upstream()
+    inline_reply.current_slot.set(None)
+    run(InlineReplyMiddleware()(upstream, None, SendMessage(chat_id=1, text="x")))
+    assert upstream.calls == ["SendMessage"]
+
+
+def test_build_reply(run):
+    bot = Bot("42:TEST")
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Выйти", callback_data="ai:exit")]])
+    body = Body()
+
+    async def scenario():
+        await build_reply(bot, SendMessage(chat_id=7, text="Привет", reply_markup=markup)).write(body)
+        await bot.session.close()
+
+    run(scenario())
+    fields = dict(re.findall(r'name="([^"]+)"\r\n\r\n(.*?)\r\n--', body.data.decode(), re.S))
+    # unset fields are left out
+    assert fields.keys() == {"method", "chat_id", "text", "reply_markup"}
+    assert fields["method"] == "sendMessage" and fields["chat_id"] == "7" and fields["text"] == "Привет"
+    assert json.loads(fields["reply_markup"])["inline_keyboard"][0][0]["callback_data"] == "ai:exit"
@@ -0,0 +1,56 @@
+import pytest
+
+from services.local_kb import KBEntry, LocalKB
+
+
+@pytest.fixture
+def kb() -> LocalKB:
+    kb = LocalKB()
+    kb.add(KBEntry("Jameson", "Irish whiskey", our_alt="Tullamore D.E.W."), ["jameson", "джеймсон", "джемисон"])
+    kb.add(KBEntry("Glenfiddich 12 Years"), ["glenfiddich 12 years", "glenfiddich 12", "glenfiddich"])
+    kb.add(KBEntry("Glenfiddich IPA"), ["glenfiddich ipa", "ipa experiment", "ipa"])
+    kb.add(KBEntry("Devil’s Rock Riesling"), ["devils rock riesling", "рислинг"])
+    kb.add(KBEntry("Coors"), ["coors", "курс"])
+    return kb
+
+
+def title(kb: LocalKB, key: str):
+    entry = kb.lookup(key)
+    return entry.title if entry else None
+
+
+def test_exact_alias(kb):
+    assert title(kb, "джеймсон") == "Jameson"
+    assert title(kb, "ipa") == "Glenfiddich IPA"
+    assert kb.counters["exact_hits"] == 2
+
+
+def test_token_coverage_prefers_longest_alias(kb):
+    assert title(kb, "glenfiddich 12 лет") == "Glenfiddich 12 Years"
+    assert title(kb, "glenfiddich ipa виски") == "Glenfiddich IPA"
+    assert kb.counters["token_hits"] == 2
+
+
+def test_fuzzy_whole_query(kb):
+    assert title(kb, "джемисонн") == "Jameson"
+    assert title(kb, "glenfidich") == "Glenfiddich 12 Years"
+    assert kb.counters["fuzzy_hits"] == 2
+
+
+@pytest.mark.parametrize("key", [
+    "какой курс доллара",
+    "что такое ipa",
+    "расскажи про рислинг",
+    "что лучше jameson или tullamore",
+    "",
+])
+def test_question_mentioning_alias_is_a_miss(kb, key):
+    assert kb.lookup(key) is None
+    assert kb.stats()["misses"] == 1
+
+
+def test_stats(kb):
+    kb.lookup("jameson")
+    kb.lookup("какой курс доллара")
+    stats = kb.stats()
+    assert stats["lookups"] == 2 and stats["entries"] == 5 and stats["hit_rate"] == 0.5
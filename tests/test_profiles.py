@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from services import profiles, storage
+from tests.conftest import fake_redis
+
+USERS = {
+    1: {"first_name": "Alexander", "last_name": "Ivanov", "username": "sasha"},
+    2: {"first_name": "Alex", "last_name": "Petrov"},
+    3: {"first_name": "Alexey", "last_name": "Smirnov", "username": "lex_smirnov"},
+    4: {"first_name": "Мария", "last_name": "Алексеева"},
+    5: {"first_name": "Олег", "username": "oleg_alex"},
+}
+
+
+@pytest.fixture(params=["fakeredis", "memory"])
+def redis(request, run):
+    storage.redis = fake_redis() if request.param == "fakeredis" else storage.MemoryRedis()
+    for uid, info in USERS.items():
+        run(profiles.update(uid, **info))
+    return storage.redis
+
+
+async def index_state(r) -> dict:
+    state = {}
+    for pattern in ("idx:name:*", "idx:tok:*"):
+        async for key in r.scan_iter(pattern):
+            state[key] = await r.smembers(key)
+    state["phones"] = await r.hgetall(profiles.PHONE_INDEX)
+    return {key: members for key, members in state.items() if members}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+7 (701) 123-45-67", "+77011234567"),
+    ("87011234567", "+77011234567"),
+    ("7011234567", "+77011234567"),
+    ("+44 20 7946 0958", "+442079460958"),
+    ("", ""),
+    ("no digits", ""),
+])
+def test_normalize_phone(raw, expected):
+    assert profiles.normalize_phone(raw) == expected
+
+
+def test_rank_order():
+    info = {"first_name": "Alexander", "last_name": "Ivanov", "username": "sasha_k"}
+    assert profiles._rank("ivanov", info) == 0
+    assert profiles._rank("alex", info) == 1
+    assert profiles._rank("xand", info) == 2
+    assert profiles._rank("petrov", info) is None
+
+
+def test_search_ranks_whole_tokens_then_prefixes_then_substrings(run, redis):
+    # Alex and oleg_alex have the whole token, Alexander and Alexey start with it
+    assert run(profiles.search("alex")) == [2, 5, 1, 3]
+    assert run(profiles.search("лекс")) == [4]
+    assert run(profiles.search("al iv")) == [1]
+    assert run(profiles.search("a")) == [2, 1, 3, 5]
+    assert run(profiles.search("nobody")) == []
+
+
+def test_search_fetches_a_bounded_number_of_candidates(run, redis, monkeypatch):
+    for uid in range(100, 400):
+        run(profiles.update(uid, first_name=f"Alexandra{uid}"))
+    monkeypatch.setattr(profiles, "MAX_CANDIDATES", 50)
+    fetched = []
+    pipeline = storage.redis.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        hmget = pipe.hmget
+
+        def counted(*a, **kw):
+            fetched.append(a[0])
+            return hmget(*a, **kw)
+
+        pipe.hmget = counted
+        return pipe
+
+    monkeypatch.setattr(storage.redis, "pipeline", counting_pipeline)
+    # the whole-token match comes first although 300 prefix matches are skipped
+    assert run(profiles.search("alex", limit=3)) == [2, 5, 1]
+    assert len(fetched) <= 50
+
+
+def test_rename_reindexes(run, redis):
+    before = run(index_state(redis))
+    run(profiles.update(2, first_name="Boris", phone="8 701 123 45 67"))
+    assert run(profiles.search("alex")) == [5, 1, 3]
+    assert run(profiles.search("boris")) == [2]
+    assert run(profiles.find_by_phone("+77011234567")) == 2
+    run(profiles.update(2, first_name="Alex", phone=""))
+    assert run(index_state(redis)) == before
+    assert run(profiles.find_by_phone("+77011234567")) is None
+
+
+def test_reindex_rebuilds_the_same_indexes(run, redis):
+    before = run(index_state(redis))
+    run(redis.sadd("idx:name:zzz", 99))
+    assert run(profiles.reindex()) == len(USERS)
+    assert run(index_state(redis)) == before
+
+
+def test_import_over_existing_profiles_leaves_no_orphans(run, redis, tmp_path):
+    run(profiles.set_phone(1, "+77011234567"))
+    path = tmp_path / "user_info.json"
+    path.write_text(json.dumps({"1": {"first_name": "Boris", "phone": "+77020000000"}}), encoding="utf-8")
+    assert run(profiles.import_json(str(path))) == 1
+    after = run(index_state(redis))
+    run(profiles.reindex())
+    assert run(index_state(redis)) == after
+    assert run(profiles.find_by_phone("+77011234567")) is None
+    assert run(profiles.search("boris")) == [1]
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+import pytest
+
+from services import retention, stats, storage
+from tests.conftest import fake_redis
+
+DAY = "2026-03-31"
+WEEK = stats.history_key("weekly", "2026-W14")
+MONTH = stats.history_key("monthly", "2026-03")
+
+
+@pytest.fixture(params=["fakeredis", "memory"])
+def redis(request, run):
+    storage.redis = fake_redis() if request.param == "fakeredis" else storage.MemoryRedis()
+    return storage.redis
+
+
+def daily(label: str = DAY) -> str:
+    return stats.history_key("daily", label)
+
+
+def test_grace_passes_add_only_the_difference(redis, run):
+    async def scenario():
+        await redis.hset(daily(), mapping={"quiz": 3, "brand": 1})
+        assert await retention._roll_day(daily(), DAY, final=False)
+        # nothing new: nothing added
+        assert not await retention._roll_day(daily(), DAY, final=False)
+        # late events reach the finished day
+        await redis.hincrby(daily(), "quiz", 2)
+        await redis.hincrby(daily(), "blitz", 1)
+        assert await retention._roll_day(daily(), DAY, final=False)
+        return await redis.hgetall(WEEK), await redis.hgetall(MONTH), await redis.hgetall(retention.rolled_key(DAY))
+
+    week, month, done = run(scenario())
+    assert week == month == {"quiz": "5", "brand": "1", "blitz": "1"}
+    assert done == week
+
+
+def test_final_pass_closes_the_day(redis, run):
+    async def scenario():
+        await redis.hset(daily(), mapping={"quiz": 3})
+        await retention._roll_day(daily(), DAY, final=False)
+        await redis.hincrby(daily(), "quiz", 1)
+        assert await retention._roll_day(daily(), DAY, final=True)
+        return (
+            await redis.hgetall(WEEK),
+            await redis.smembers(retention.ROLLED_KEY),
+            await redis.exists(retention.rolled_key(DAY)),
+        )
+
+    week, finished, done_left = run(scenario())
+    assert week == {"quiz": "4"} and finished == {DAY} and not done_left
+
+
+def test_rollup_skips_today_and_finished_days(redis, run):
+    today = date.fromisoformat(stats.today())
+    old = (today - timedelta(days=retention.ROLLUP_GRACE_DAYS + 1)).isoformat()
+    recent = (today - timedelta(days=1)).isoformat()
+
+    async def scenario():
+        for label in (old, recent, today.isoformat()):
+            await redis.hset(daily(label), mapping={"quiz": 1})
+        first = await retention.rollup()
+        # the old day is final now; the recent one is rolled again if it changed
+        await redis.hincrby(daily(old), "quiz", 5)
+        await redis.hincrby(daily(recent), "quiz", 1)
+        second = await retention.rollup()
+        return first, second, await redis.smembers(retention.ROLLED_KEY)
+
+    first, second, finished = run(scenario())
+    assert (first, second) == (2, 1)
+    assert finished == {old}
+
+
+def test_watch_error_retries_with_fresh_counts(run, monkeypatch):
+    r = storage.redis = fake_redis()
+    pipeline = r.pipeline
+    # one write from another process lands between WATCH and EXEC
+    writes = [2]
+    watches = []
+
+    def racing_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        watch = pipe.watch
+
+        async def watch_then_write(*keys):
+            await watch(*keys)
+            watches.append(keys)
+            if writes:
+                await r.hincrby(daily(), "quiz", writes.pop())
+
+        pipe.watch = watch_then_write
+        return pipe
+
+    monkeypatch.setattr(r, "pipeline", racing_pipeline)
+
+    async def scenario():
+        await r.hset(daily(), mapping={"quiz": 3})
+        assert await retention._roll_day(daily(), DAY, final=False)
+        assert not await retention._roll_day(daily(), DAY, final=False)
+        return await r.hgetall(WEEK)
+
+    # the first EXEC fails and the retry adds the 5 once
+    assert run(scenario()) == {"quiz": "5"}
+    assert len(watches) == 3
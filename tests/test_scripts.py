@@ -0,0 +1,119 @@
+"""Every Lua script and its MemoryRedis twin must agree, in results and in what they leave behind."""
+import json
+
+import pytest
+
+from services import leaderboards, stats, storage
+from tests.conftest import fake_redis
+
+
+async def dump(r, keys: list[str]) -> dict:
+    state = {}
+    for key in keys:
+        kind = await r.type(key)
+        if kind == "string":
+            state[key] = await r.get(key)
+        elif kind == "hash":
+            state[key] = await r.hgetall(key)
+        elif kind == "zset":
+            state[key] = [(m, float(s)) for m, s in await r.zrevrange(key, 0, -1, withscores=True)]
+        else:
+            state[key] = kind
+    return state
+
+
+def both(run, prepare, calls, keys: list[str]) -> tuple:
+    """Run ``calls(r)`` after ``prepare(r)`` on fakeredis and on MemoryRedis; return both outcomes."""
+    outcomes = []
+    for r in (fake_redis(), storage.MemoryRedis()):
+        async def go():
+            storage.redis = r
+            await prepare(r)
+            results = await calls()
+            return results, await dump(r, keys)
+        outcomes.append(run(go()))
+    return tuple(outcomes)
+
+
+async def nothing(r) -> None:
+    pass
+
+
+def test_hmax(run):
+    async def calls():
+        return [
+            await stats.hmax(["h"], [field, value])
+            for field, value in (("best_blitz", 5), ("best_blitz", 3), ("best_blitz", 9), ("best_truth", 0))
+        ]
+
+    real, memory = both(run, nothing, calls, ["h"])
+    assert real == memory
+    assert real[0] == [5, 5, 9, 0]
+
+
+def test_hmax_zero_creates_nothing(run):
+    async def calls():
+        return await stats.hmax(["h"], ["best_blitz", 0])
+
+    real, memory = both(run, nothing, calls, ["h"])
+    assert real == memory == (0, {"h": "none"})
+
+
+def test_hmax_in_pipeline(run):
+    async def prepare(r):
+        await r.hset("h", "best_blitz", "7")
+
+    async def calls():
+        async with storage.redis.pipeline(transaction=True) as pipe:
+            await stats.hmax(["h"], ["best_blitz", 4], client=pipe)
+            await stats.hmax(["h"], ["best_blitz", 12], client=pipe)
+            return await pipe.execute()
+
+    real, memory = both(run, prepare, calls, ["h"])
+    assert real == memory
+    assert real[1] == {"h": {"best_blitz": "12"}}
+
+
+def test_brand_view(run):
+    board = leaderboards.board_key("brands")
+
+    async def calls():
+        views = (("Jameson", "whisky", 1), ("Jameson", "whisky", 1), ("Coors", "beer", 1), ("Coors", "beer", 2))
+        return [
+            await leaderboards.brand_view([f"user:{uid}:stats:brands", board], [brand, category, uid])
+            for brand, category, uid in views
+        ]
+
+    real, memory = both(run, nothing, calls, ["user:1:stats:brands", "user:2:stats:brands", board])
+    assert real == memory
+    assert real[0] == [1, 0, 1, 1]
+
+
+@pytest.mark.parametrize("legacy", [
+    {"tests": 3, "points": 17, "last": "2024-05-01 10:00", "best_blitz": 9,
+     "brands": {"Jameson": "whisky", "Coors": "beer"}, "name": "dropped"},
+    {"tests": 1},
+    {"brands": []},
+])
+def test_migrate(run, legacy):
+    async def prepare(r):
+        await r.set("user:1:stats", json.dumps(legacy))
+
+    async def calls():
+        keys = ["user:1:stats", "user:1:stats:brands"]
+        return [await stats.migrate_key(keys, []), await stats.migrate_key(keys, [])]
+
+    real, memory = both(run, prepare, calls, ["user:1:stats", "user:1:stats:brands"])
+    assert real == memory
+    assert real[0] == [1, 0]
+
+
+def test_migrate_leaves_hashes_alone(run):
+    async def prepare(r):
+        await r.hset("user:1:stats", mapping={"tests": "2"})
+
+    async def calls():
+        return await stats.migrate_key(["user:1:stats", "user:1:stats:brands"], [])
+
+    real, memory = both(run, prepare, calls, ["user:1:stats", "user:1:stats:brands"])
+    assert real == memory == (0, {"user:1:stats": {"tests": "2"}, "user:1:stats:brands": "none"})
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, SendPhoto
+from aiogram.types import InlineKeyboardMarkup
+
+from services import send_queue
+from services.send_queue import SendScheduler
+
+WINDOW = 0.05
+
+
+class Upstream:
+    """Stands in for the session: records calls, optionally slow or flooded."""
+
+    def __init__(self, delays: dict = None, floods: int = 0) -> None:
+        self.calls = []
+        self.delays = delays or {}
+        self.floods = floods
+
+    async def __call__(self, bot, method):
+        if self.floods:
+            self.floods -= 1
+            raise TelegramRetryAfter(method, "Too Many Requests", 0)
+        await asyncio.sleep(self.delays.get(getattr(method, "text", None), 0))
+        self.calls.append((method.chat_id, getattr(method, "text", None) or getattr(method, "photo", None)))
+        return method.chat_id
+
+
+def scheduler(merge: bool = False) -> SendScheduler:
+    return SendScheduler(rate=1000, chat_rate=1000, chat_burst=1000, merge=merge, merge_window=WINDOW)
+
+
+def test_calls_to_one_chat_keep_their_order(run):
+    upstream = Upstream(delays={"first": 0.05})
+    sched = scheduler()
+
+    async def scenario():
+        first = asyncio.ensure_future(sched(upstream, None, SendMessage(chat_id=1, text="first")))
+        await asyncio.sleep(0)
+        await asyncio.gather(
+            sched(upstream, None, SendMessage(chat_id=1, text="second")),
+            sched(upstream, None, SendMessage(chat_id=2, text="other chat")),
+        )
+        await first
+
+    run(scenario())
+    # the other chat is not held up by chat 1's slow call
+    assert upstream.calls == [(2, "other chat"), (1, "first"), (1, "second")]
+    assert sched.metrics()["busy_chats"] == 0
+
+
+def test_text_messages_merge(run):
+    upstream = Upstream()
+    sched = scheduler(merge=True)
+
+    async def scenario():
+        held = await sched(upstream, None, SendMessage(chat_id=1, text="a"))
+        assert held.message_id == 0 and held.text == "a"
+        await sched(upstream, None, SendMessage(chat_id=1, text="b"))
+        await asyncio.sleep(WINDOW * 3)
+
+    run(scenario())
+    assert upstream.calls == [(1, "a\n\nb")]
+    assert sched.counters["merged"] == 1 and sched.counters["sent"] == 1
+
+
+def test_held_message_goes_before_unmergeable_call(run):
+    upstream = Upstream()
+    sched = scheduler(merge=True)
+    markup = InlineKeyboardMarkup(inline_keyboard=[])
+
+    async def scenario():
+        await sched(upstream, None, SendMessage(chat_id=1, text="a"))
+        await sched(upstream, None, SendPhoto(chat_id=1, photo="file-id"))
+        await sched(upstream, None, SendMessage(chat_id=1, text="menu", reply_markup=markup))
+
+    run(scenario())
+    assert upstream.calls == [(1, "a"), (1, "file-id"), (1, "menu")]
+    assert not sched.counters["merged"]
+
+
+def test_held_message_is_flushed_after_window(run):
+    upstream = Upstream()
+    sched = scheduler(merge=True)
+
+    async def scenario():
+        await sched(upstream, None, SendMessage(chat_id=1, text="alone"))
+        assert upstream.calls == []
+        await asyncio.sleep(WINDOW * 3)
+
+    run(scenario())
+    assert upstream.calls == [(1, "alone")]
+    assert sched.metrics()["held_now"] == 0
+
+
+def test_flush_all_sends_held_messages(run):
+    upstream = Upstream()
+    sched = scheduler(merge=True)
+
+    async def scenario():
+        await sched(upstream, None, SendMessage(chat_id=1, text="bye"))
+        await sched.flush_all()
+
+    run(scenario())
+    assert upstream.calls == [(1, "bye")]
+
+
+def test_retry_after_is_retried(run):
+    upstream = Upstream(floods=2)
+    sched = scheduler()
+
+    assert run(sched(upstream, None, SendMessage(chat_id=1, text="x"))) == 1
+    assert upstream.calls == [(1, "x")]
+    assert sched.counters["retry_after"] == 2
+
+
+def test_retry_after_gives_up(run, monkeypatch):
+    monkeypatch.setattr(send_queue, "SEND_MAX_RETRIES", 1)
+    upstream = Upstream(floods=5)
+    sched = scheduler()
+
+    with pytest.raises(TelegramRetryAfter):
+        run(sched(upstream, None, SendMessage(chat_id=1, text="x")))
+    assert upstream.calls == [] and upstream.floods == 3
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services import storage, web_search
+from services.web_search import CircuitBreaker
+
+COOLDOWN = 0.05
+PAGE = {"webPages": {"value": [{"name": "Jameson", "snippet": "Irish whiskey", "url": "https://x", "id": "1"}]}}
+
+
+@pytest.fixture
+def breaker(monkeypatch) -> CircuitBreaker:
+    breaker = CircuitBreaker(threshold=2, cooldown=COOLDOWN)
+    monkeypatch.setattr(web_search, "breaker", breaker)
+    return breaker
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.threshold):
+        breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(COOLDOWN * 1.2)
+    assert breaker.state == "half_open"
+
+
+def test_half_open_probe_success_closes(breaker):
+    open_breaker(breaker)
+    assert breaker.allow()
+    # one probe at a time
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_half_open_probe_failure_reopens(breaker):
+    open_breaker(breaker)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+@pytest.fixture
+def upstream(run, monkeypatch, breaker):
+    """Fake Bing endpoint; each request is answered by the next ``(delay, body)`` in ``replies``."""
+    replies: list = []
+
+    async def handle(request: web.Request) -> web.Response:
+        delay, body = replies.pop(0) if replies else (0, PAGE)
+        await asyncio.sleep(delay)
+        return web.json_response(body)
+
+    app = web.Application()
+    app.router.add_get("/search", handle)
+    server = TestServer(app)
+    run(server.start_server())
+    monkeypatch.setattr(web_search, "ENDPOINT", str(server.make_url("/search")))
+    monkeypatch.setenv("BING_API_KEY", "test")
+    monkeypatch.setattr(web_search, "cache", web_search.TTLCache(16, 60))
+    web_search.counters.clear()
+    storage.redis = storage.MemoryRedis()
+    run(web_search.start())
+    yield replies
+    run(web_search.close())
+    run(server.close())
+
+
+def fetch(timeout: float = 1):
+    return web_search.fetch("q", "test", mkt="ru-RU", count=5, timeout=timeout)
+
+
+def test_fetch_keeps_result_fields(run, upstream, breaker):
+    assert run(fetch()) == [{"name": "Jameson", "snippet": "Irish whiskey", "url": "https://x"}]
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize("body", [[1, 2], "text", {"webPages": []}, {"webPages": {"value": [1]}}])
+def test_badly_shaped_body_is_a_failure(run, upstream, breaker, body):
+    upstream.append((0, body))
+    assert run(fetch()) is None
+    assert breaker.failures == 1
+
+
+def test_badly_shaped_probe_reopens(run, upstream, breaker):
+    open_breaker(breaker)
+    assert breaker.allow()
+    upstream.append((0, [1]))
+    assert run(fetch()) is None
+    assert breaker.state == "open"
+
+
+def test_cancelled_probe_lets_the_next_request_probe(run, upstream, breaker):
+    open_breaker(breaker)
+    assert breaker.allow()
+    upstream.append((1, PAGE))
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(fetch())
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    run(cancel_probe())
+    assert breaker.allow()
+
+
+def test_hedge_answers_when_the_first_call_is_slow(run, upstream, monkeypatch):
+    monkeypatch.setattr(web_search, "HEDGE_AFTER", 0.05)
+    upstream.extend([(1, PAGE), (0, PAGE)])
+    started = time.monotonic()
+    results = run(web_search.search("jameson", "jameson"))
+    assert results and results[0]["name"] == "Jameson"
+    assert time.monotonic() - started < 0.5
+    assert web_search.counters["hedged"] == 1
+
+
+def test_deadline_bounds_the_lookup(run, upstream, breaker, monkeypatch):
+    monkeypatch.setattr(web_search, "BUDGET", 0.1)
+    upstream.append((1, PAGE))
+    started = time.monotonic()
+    assert run(web_search.search("slow", "slow")) == []
+    assert time.monotonic() - started < 0.5
+    assert breaker.failures == 1
+    # a failed lookup is not cached
+    assert run(web_search.search("slow", "slow")) == [{"name": "Jameson", "snippet": "Irish whiskey", "url": "https://x"}]